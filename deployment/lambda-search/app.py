@@ -1,15 +1,30 @@
+import os
+import glob
 import json
+import time
 import boto3
-import requests
+import threading
 
 from os import environ
 from datetime import datetime
-from urllib.parse import urlparse
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-from requests_aws4auth import AWS4Auth
+from opensearchpy import NotFoundError
 
 from filter_builder import *
 from dashboard import *
+from connection import get_os_client, OS_TRANSPORT
+from cache import embedding_cache, response_cache, index_versions, canonical_lang, canonical_request, canonical_request_key
+from query_compiler import FILTER_CONFIG_PATH, get_filter_config, filter_ast, compile_filters, compile_aggregations, compile_sort, compile_source_filter, build_knn_clause, build_exact_knn_clause, build_rescore, knn_k, oversampled_k, KNN_OVERSAMPLE_FACTOR, KNN_RESCORE
+from response_builder import create_api_response_geojson, json_dumps
+from http_response import HTTP_RESPONSE_MODE, RequestError, request_header, response_fingerprint, compute_etag, etag_matches, cache_control, build_http_response, not_modified_response
+from local_encoder import ENCODER_MODE, get_local_encoder
+from fusion import SEARCH_MODE, HYBRID_MIN_SCORE, build_hybrid_clauses, build_hybrid_query, build_fusion_searches, fused_search_results, leg_k
+from planner import estimate_candidates, plan_knn
+from pagination import InvalidCursor, CursorLimitExceeded, start_cursor, decode_cursor, apply_cursor, next_cursor, close_cursor
+from stages import StageGraph, REQUEST_DEADLINE_SECONDS, OPENSEARCH_REQUEST_TIMEOUT
+from timing import RequestTimer, SERVER_TIMING_HEADER, span
+from vector_store import create_vector_store, vector_key, SHARED_EMBEDDING_CACHE
+from browse_cache import BrowseCache
+from startup import PREWARM_ON_INIT, PREWARM_QUERY_SECONDS, prewarm_queries, prewarm_deadline, run_prewarm
 
 #Global variables for prod 
 region = environ['MY_AWS_REGION']
@@ -19,6 +34,19 @@ os_secret_id = environ['OS_SECRET_ID']
 model_name = environ['MODEL_NAME']
 search_index_name = environ['NEW_INDEX_NAME']
 
+# Optional query-vector cache tier shared across containers
+shared_vector_store = create_vector_store(SHARED_EMBEDDING_CACHE, region=region)
+
+def get_async_analytics_client():
+    from async_transport import get_async_os_client
+    return get_async_os_client(aos_host, region)
+
+# Search logs for the OpenSearch dashboard are buffered and bulk-written in the background
+analytics_logger = AnalyticsLogger(
+    lambda: get_os_client(aos_host, region), search_index_name,
+    async_client_factory=get_async_analytics_client if OS_TRANSPORT == 'async' else None
+)
+
 def get_awsauth_from_secret(region, secret_id):
     """
     Retrieves AWS opensearh credentials stored in AWS Secrets Manager.
@@ -39,35 +67,94 @@ def get_awsauth_from_secret(region, secret_id):
         return None
         
         
-def invoke_sagemaker_endpoint(sagemaker_endpoint, payload, region):
+_sagemaker_client = None
+_sagemaker_client_lock = threading.Lock()
+
+def get_sagemaker_client():
+    """SageMaker runtime client shared by every invocation on this container."""
+    global _sagemaker_client
+    if _sagemaker_client is None:
+        with _sagemaker_client_lock:
+            if _sagemaker_client is None:
+                _sagemaker_client = boto3.client('runtime.sagemaker', region_name=region)
+    return _sagemaker_client
+
+def invoke_sagemaker_endpoint(sagemaker_endpoint, payload, region, timer=None):
     """Invoke a SageMaker endpoint to get embedding with ContentType='text/plain'."""
-    runtime_client = boto3.client('runtime.sagemaker', region_name=region)  
+    # Popular queries repeat constantly, serve their vectors from the container cache
+    cached = embedding_cache.get(model_name, sagemaker_endpoint, payload)
+    if cached is not None:
+        if timer:
+            timer.set("embedding_source", "cache")
+        return cached
+
+    # Then the tier shared by all containers, so cold containers start warm
+    shared_key = vector_key(model_name, sagemaker_endpoint, payload) if shared_vector_store else None
+    if shared_key:
+        cached = shared_vector_store.get(shared_key)
+        if cached is not None:
+            embedding_cache.put(model_name, sagemaker_endpoint, payload, cached)
+            if timer:
+                timer.set("embedding_source", "shared_cache")
+            return cached
+
+    runtime_client = get_sagemaker_client()
     try:
         # Ensure payload is a string, since ContentType is 'text/plain'
         if not isinstance(payload, str):
             payload = str(payload)
         
-        response = runtime_client.invoke_endpoint(
-            EndpointName=sagemaker_endpoint,
-            ContentType='text/plain',
-            Body=payload
-        )
-        
-        result = json.loads(response['Body'].read().decode())
+        # Round trip including the model; the endpoint does not report the model time separately
+        with span(timer, "sagemaker"):
+            response = runtime_client.invoke_endpoint(
+                EndpointName=sagemaker_endpoint,
+                ContentType='text/plain',
+                Body=payload
+            )
+            result = json.loads(response['Body'].read().decode())
+        if timer:
+            timer.set("embedding_source", "sagemaker")
+        if result:
+            embedding_cache.put(model_name, sagemaker_endpoint, payload, result)
+            if shared_key:
+                shared_vector_store.put_async(shared_key, result)
         return (result)
     except Exception as e:
         print(f"Error invoking SageMaker endpoint {sagemaker_endpoint}: {e}")
         
 
-def semantic_search_neighbors(lang, search_text, features, os_client, sort_param, k_neighbors=50, from_param=0, idx_name=model_name, filters=None, size=10):
+def embed_query(payload, timer=None):
+    """
+    Embeds the search text in-process when ENCODER_MODE is 'local', falling back to
+    the SageMaker endpoint if the local encoder is unavailable.
+    """
+    if ENCODER_MODE == 'local':
+        try:
+            with span(timer, "local_encoder"):
+                features = get_local_encoder().encode(payload)
+            if timer:
+                timer.set("embedding_source", "local")
+            return features
+        except Exception as e:
+            print(f"Error embedding query with the local encoder, using SageMaker: {e}")
+    return invoke_sagemaker_endpoint(sagemaker_endpoint, payload, region, timer)
+
+def semantic_search_neighbors(lang, search_text, features, os_client, sort_param, k_neighbors=50, from_param=0, idx_name=model_name, filters=None, size=10, knn_strategy="ann", cursor_state=None, search_mode=SEARCH_MODE, oversample_factor=KNN_OVERSAMPLE_FACTOR, rescore=KNN_RESCORE, request_timeout=OPENSEARCH_REQUEST_TIMEOUT, timer=None):
     """
     Perform semantic search and get neighbots using the cosine similarity of the vectors 
+    knn_strategy: 'ann' for the HNSW knn clause, 'exact' for brute-force cosine scoring of the filtered documents
+    search_mode: 'hybrid' for one bool.should query, 'fusion' for separate lexical and vector legs fused with RRF
+                 or min-max (see fusion.py); relevancy-sorted, non-cursor requests only
+    oversample_factor: fetch k_neighbors times this many approximate neighbours (compressed-vector indexes)
+    rescore: rescore the oversampled window with exact cosine similarity on the full-precision vectors;
+             relevancy-sorted, non-cursor 'ann' requests only
+    request_timeout: seconds to wait for OpenSearch, the handler passes what is left of the request deadline
+    cursor_state: when set, pages with a point-in-time and search_after instead of from/size (see pagination.py)
+    timer: optional RequestTimer receiving the OpenSearch round trip, its reported 'took' and the response build time
     output: a list of json, each json contains _id, _score, title, and uuid 
     """
-    filter_config = load_config()
-    # Correct language suffix
-    org_field_lang = "organisation.en.keyword" if lang == "en" else "organisation.fr.keyword"
     #print("Filters:", json.dumps(filters, indent=2))
+    # Only the per-request parts are built here; the aggregation block is compiled once per language
     query = {
         "query": {
             "bool": {
@@ -78,81 +165,45 @@ def semantic_search_neighbors(lang, search_text, features, os_client, sort_param
         "size": size,
         "from": from_param,
         "sort": sort_param,
-        "aggs": {
-            "unique_mappable": {
-                "terms": {
-                    "field": filter_config["mappable"][0],
-                    "size": 100
-                }
-            },
-            "unique_protocol": {
-                "terms": {
-                    "field": filter_config["protocol"][0],
-                    "size": 100
-                }
-            },
-            "unique_org": {
-                "terms": {
-                    "field": org_field_lang,
-                    "size": 100
-                }
-            },
-            "unique_source_system": {
-                "terms": {
-                    "field": filter_config["source_system"][0],
-                    "size": 100
-                }
-            },
-            "unique_eo_collection": {
-                "terms": {
-                    "field": filter_config["eo_collection"][0],
-                    "size": 100
-                }
-            },
-            "unique_topic_category": {
-                "terms": {
-                    "field": filter_config["topic_category"][0],
-                    "size": 100
-                }
-            },
-            "unique_theme": {
-                "terms": {
-                    "field": filter_config["theme"][0],
-                    "size": 100
-                }
-            }
-        }
+        "_source": compile_source_filter(),  # Never fetch the vector or other unused heavy fields
+        "aggs": compile_aggregations(lang)
     }
 
     # Include the knn (i.e., vectors) only if features are provided in case of empty keyword query
     if features:
         #Note: this is technically a hybrid search
-        query["query"]["bool"]["should"] = [
-            {
-                "multi_match": {
-                    "query": search_text,
-                    "fields": ["*topicCategory*", "*keywords*^5", "*description*^15", "*title*^10", "*organisation*", "*systemName*", "*id*^5"],  # Boost title field
-                    "type": "best_fields",  # BM25 scoring
-                    "boost": 0.007
+        relevancy_sorted = not cursor_state and "_score" in sort_param[0]
+        rescore = rescore and knn_strategy != "exact" and relevancy_sorted
+        ann_k = oversampled_k(k_neighbors, oversample_factor)
+        knn_clause = build_exact_knn_clause(features, filters) if knn_strategy == "exact" else build_knn_clause(features, ann_k, filters)
+        if search_mode == "fusion" and relevancy_sorted:
+            # Lexical and vector legs are ranked separately and fused here instead of blending raw scores
+            fusion_k = leg_k(from_param, size)
+            leg_ann_k = oversampled_k(fusion_k, oversample_factor)
+            leg_knn_clause = build_exact_knn_clause(features, filters) if knn_strategy == "exact" else build_knn_clause(features, leg_ann_k, filters)
+            vector_rescore = build_rescore(build_exact_knn_clause(features), leg_ann_k) if rescore else None
+            # The total and the facets come from the hybrid query, as in hybrid mode
+            totals_query = build_hybrid_query(search_text, knn_clause, filters)
+            with span(timer, "opensearch"):
+                res = os_client.msearch(
+                    request_timeout=request_timeout,
+                    body=build_fusion_searches(idx_name, search_text, leg_knn_clause, filters, fusion_k, query["_source"], query["aggs"], vector_rescore, totals_query))
+            with span(timer, "response_build"):
+                fused = fused_search_results(res, from_param, size)
+                api_response = create_api_response_geojson(fused, lang)
+            if timer:
+                timer.record("opensearch_took", fused.get("took"))
+            return api_response
+
+        query["query"]["bool"]["should"] = build_hybrid_clauses(search_text, knn_clause)
+        if rescore:
+            # Same hybrid scoring, with exact cosine similarity instead of the compressed-graph estimate
+            query["rescore"] = build_rescore({
+                "bool": {
+                    "should": build_hybrid_clauses(search_text, build_exact_knn_clause(features)),
+                    "minimum_should_match": 1
                 }
-            },
-            {
-                "term": {
-                    "mappable": {
-                        "value": True,
-                        "boost": 0.15   # adjust boost as needed
-                    }
-                }
-            },
-            {
-                "knn": {
-                    "vector": {
-                        "vector": features,
-                        "k": k_neighbors
-                    }
-                }
-            }
-        ]
+            }, ann_k)
         query["query"]["bool"]["minimum_should_match"] = 1 # Ensure at least one match        
 
         
@@ -162,14 +213,27 @@ def semantic_search_neighbors(lang, search_text, features, os_client, sort_param
         #        "_name": search_text  # Embed search text as metadata
         #    }
         #})
-        query["min_score"] = 0.55
+        query["min_score"] = HYBRID_MIN_SCORE
             
     #print(json.dumps(query, indent=2))
     
-    res = os_client.search(
-        request_timeout=55, 
-        index=idx_name,
-        body=query)
+    with span(timer, "opensearch"):
+        if cursor_state:
+            # Point-in-time searches must not name the index
+            try:
+                res = os_client.search(
+                    request_timeout=request_timeout,
+                    body=apply_cursor(query, cursor_state))
+            except NotFoundError:
+                close_cursor(os_client, cursor_state["pit"])
+                raise InvalidCursor("Cursor expired (more than PIT_KEEP_ALIVE between pages), start again with paging=cursor")
+        else:
+            res = os_client.search(
+                request_timeout=request_timeout, 
+                index=idx_name,
+                body=query)
+    if timer:
+        timer.record("opensearch_took", res.get("took"))
 
     #print(res)
     
@@ -180,19 +244,23 @@ def semantic_search_neighbors(lang, search_text, features, os_client, sort_param
     # query_result_df = pd.DataFrame(data=query_result,columns=["_id","_score","title",'uuid'])
     # return query_result_df
 
-    api_response = create_api_response_geojson(res, lang)
+    with span(timer, "response_build"):
+        api_response = create_api_response_geojson(res, lang)
     #api_response = create_api_response(res)
+    if cursor_state:
+        api_response["next_cursor"] = next_cursor(cursor_state, res, size)
+        # Last page: free the point-in-time now rather than when its keep_alive runs out
+        if api_response["next_cursor"] is None:
+            close_cursor(os_client, res.get("pit_id", cursor_state["pit"]))
     return api_response 
 
-def text_search_keywords(lang, payload, os_client, k=30,idx_name=model_name):
+def text_search_keywords(lang, payload, os_client, k=30,idx_name=model_name, request_timeout=OPENSEARCH_REQUEST_TIMEOUT, timer=None):
     """
     Keyword search of the payload string 
     """
     search_body = {
         "size": k,
-        "_source": {
-            "excludes": ["vector"]
-        },
+        "_source": compile_source_filter(),
         "highlight": {
             "fields": {
                 "description": {}
@@ -206,10 +274,13 @@ def text_search_keywords(lang, payload, os_client, k=30,idx_name=model_name):
         }
     }
     
-    res = os_client.search(
-        request_timeout=55, 
-        index=idx_name,
-        body=search_body)
+    with span(timer, "opensearch"):
+        res = os_client.search(
+            request_timeout=request_timeout, 
+            index=idx_name,
+            body=search_body)
+    if timer:
+        timer.record("opensearch_took", res.get("took"))
     
     # query_result = [
     #     [hit['_id'], hit['_score'], hit['_source']['title'], hit['_source']['id']]
@@ -217,7 +288,8 @@ def text_search_keywords(lang, payload, os_client, k=30,idx_name=model_name):
     # query_result_df = pd.DataFrame(data=query_result,columns=["_id","_score","title",'uuid'])
     # return query_result_df
     
-    api_response = create_api_response_geojson(res, lang)
+    with span(timer, "response_build"):
+        api_response = create_api_response_geojson(res, lang)
     return api_response 
 
 def add_to_top_of_dict(original_dict, key, value):
@@ -252,57 +324,6 @@ def create_api_response(search_results):
             print(f"Error processing hit: {e}")
     return response
 """
-def create_api_response_geojson(search_results, lang):
-
-    total_hits = search_results['hits']['total']['value'] if 'total' in search_results['hits'] else 0
-    returned_hits = len(search_results['hits']['hits'])
-
-    response = {
-
-        "total_hits": total_hits,        # Total docs matching the query
-        "returned_hits": returned_hits,  # Number of docs returned (limited by size)
-        "aggs": search_results.get("aggregations", {}),
-        "items": []
-    }
-    
-    for count, hit in enumerate(search_results['hits']['hits'], start=1):
-        try:
-            source_data = hit['_source'].copy()
-            source_data.pop('vector', None)
-            source_data = add_to_top_of_dict(source_data, 'relevancy', hit.get('_score', ''))
-            source_data = add_to_top_of_dict(source_data, 'row_num', count)
-
-            #print(lang)
-            #if lang == 'fr':  
-            #    uuid = source_data.get('id')
-            #    if uuid:
-            #        title, description, keywords = language_config(uuid)
-            #        #print(title)
-            #        if title and description and keywords:
-            #            source_data['title'] = title  
-            #            source_data['description'] = description
-            #            source_data['keywords'] = keywords
-                
-            #Get geometry and delete geometry from the source_data
-            geometry = source_data.get('coordinates')
-            source_data.pop('coordinates')
-            #Create the GeoJson object 
-            feature_collection = {
-                    "type": "FeatureCollection",
-                    "features": [
-                        {
-                            "type": "Feature",
-                            "geometry": geometry,
-                            "properties": source_data
-                        }
-                    ]
-                }
-    
-            response["items"].append(feature_collection)    
-        except Exception as e:
-            print(f"Error processing hit: {hit} - {e}")
-    return response
-
 # Load configuration file
 def load_config(file_path="filter_config.json"):
     """
@@ -330,33 +351,91 @@ def load_config(file_path="filter_config.json"):
         "order": "$input.params('order')",
         "size": "$input.params('size')",
         "from": "$input.params('from')",
+        "paging": "$input.params('paging')",
+        "cursor": "$input.params('cursor')",
+        "accept_encoding": "$input.params('Accept-Encoding')",
+        "if_none_match": "$input.params('If-None-Match')",
         "ip_address": "$context.identity.sourceIp",
         "timestamp": "$context.requestTimeEpoch",
         "user_agent": "$context.identity.userAgent",
         "http_method": "$context.httpMethod"
         }
     """
-    with open(file_path, "r") as file:
-        return json.load(file)
+    return get_filter_config(file_path)
     
+def build_browse_page(canonical, index_version):
+    """
+    One page of the empty-query listing for the browse cache, searched like the
+    handler's SemanticSearch path.
+    """
+    os_client = get_os_client(aos_host, region)
+    ast = filter_ast(canonical)
+    filters = compile_filters(ast)
+    features = embed_query(canonical["q"])
+    knn_strategy = plan_knn(estimate_candidates(os_client, model_name, filters, (index_version, ast)))
+    semantic_search = semantic_search_neighbors(
+        lang=canonical["lang"],
+        search_text=canonical["q"],
+        features=features,
+        os_client=os_client,
+        k_neighbors=knn_k(canonical["from"], canonical["size"]),
+        from_param=canonical["from"],
+        idx_name=model_name,
+        filters=filters,
+        sort_param=compile_sort(canonical["lang"], canonical["sort"], canonical["order"]),
+        size=canonical["size"],
+        knn_strategy=knn_strategy
+    )
+    return {"method": "SemanticSearch", "response": semantic_search}
+
+browse_cache = BrowseCache(build_browse_page)
+
+# A deploy or a change of the response settings changes every ETag
+ETAG_FINGERPRINT = response_fingerprint(
+    glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")) + [FILTER_CONFIG_PATH]
+)
+
+def refresh_browse_cache():
+    """Rebuilds the browse pages of this container, for a scheduled {"browse_cache_refresh": true} event."""
+    if not browse_cache.enabled:
+        return {"browse_cache": "disabled"}
+    version = index_versions.get(get_os_client(aos_host, region), model_name)
+    if version is None:
+        return {"browse_cache": f"could not resolve index '{model_name}'"}
+    browse_cache.refresh(version)
+    return {"browse_cache": browse_cache.stats()}
+
 def lambda_handler(event, context):
     """
     /postText: Uses semantic search to find similar records based on vector similarity.
     Other paths: Uses a direct keyword text match to find matched records .
     """
+    if event.get('browse_cache_refresh'):
+        return refresh_browse_cache()
+
+    # Named spans of this request, logged as one JSON line (and optionally sent as Server-Timing)
+    timer = RequestTimer()
+    try:
+        return search_handler(event, context, timer)
+    except Exception as e:
+        timer.set("error", type(e).__name__)
+        raise
+    finally:
+        # Failed requests get their timing line too
+        timer.set("caches", {
+            "embedding": embedding_cache.stats(),
+            "response": response_cache.stats(),
+            "browse": browse_cache.stats()
+        })
+        timer.log()
+
+def search_handler(event, context, timer):
+    """The search request of lambda_handler, timed with timer."""
     #awsauth = get_awsauth_from_secret(region, secret_id=os_secret_id)
     #print(awsauth)
 
-    credentials = boto3.Session().get_credentials()
-    awsauth = AWS4Auth(credentials.access_key, credentials.secret_key, region, 'es', session_token=credentials.token)
-
-    os_client = OpenSearch(
-        hosts=[{'host': aos_host, 'port': 443}],
-        http_auth=awsauth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection
-    )
+    # Pooled client shared by every invocation on this container
+    os_client = get_os_client(aos_host, region)
 
     #print(event)
     
@@ -368,9 +447,6 @@ def lambda_handler(event, context):
     # Debug event
     #print("event", event)
     
-    # Load filter config from filter_config.json
-    filter_config = load_config()
-
     # Extract response variables
     from_param = event.get('from', 0)
 
@@ -383,7 +459,7 @@ def lambda_handler(event, context):
     size = 10
     size_param = event.get('size', '')
 
-    if not size_param or not size_param.isdigit():
+    if not size_param or not str(size_param).isdigit():
         size = 10
     else:
         size = int(size_param)
@@ -391,93 +467,17 @@ def lambda_handler(event, context):
     order_param = event.get('order', "desc")
 
     """ Language filter """
-    lang_filter = event.get('lang', 'en')
-    if not lang_filter:
-        lang_filter = 'en'
+    # Same value as the cache key, so that e.g. lang=EN and lang=en get the same response
+    lang_filter = canonical_lang(event.get('lang'))
 
     """ Keyword filters """
-    # Extract filters from the event input
+    # Filter values kept for the search log; the query filters are compiled from the canonical request
     organization_filter = event.get('org', None)
     metadata_source_filter = event.get('source_system', None)
     theme_filter = event.get('theme', None)
-    topicCategory_filter = event.get('topic_category', None)
     type_filter = event.get('type', None)
-    protocol_filter = event.get('protocol', None)
-    mappable_filter = event.get('mappable', None)
-    eoCollection_filter = event.get('eo_collection', None)
-    polarization_filter = event.get('polarization', None)
-    orbit_direction_filter = event.get('orbit_direction', None)
-
-    """ Temporal filters """
-    start_date_filter = event.get('begin', None)
-    end_date_filter = event.get('end', None)
-
-    """ Spatial filters """
-    spatial_filter = event.get('bbox', None)
     relation = event.get('relation', None)
 
-    # Convert filter string into list (handle multi-selection of filters) 
-    #organization_list = [org.strip() for org in organization_filter.split(",")]
-    
-
-    filters = []
-    """ Keyword filters """
-    if organization_filter:
-        organization_field = filter_config["org"]  # Get field paths from config
-        filters.append(build_wildcard_filter(organization_field, organization_filter))
-    if metadata_source_filter:
-        source_system_field = filter_config["source_system"]  # Get field paths from config
-        filters.append(build_wildcard_filter(source_system_field, metadata_source_filter))
-    if theme_filter:
-        theme_field = filter_config["theme"]  # Get field paths from config
-        filters.append(build_wildcard_filter(theme_field, theme_filter))
-    if topicCategory_filter:
-        topicCategory_field = filter_config["topic_category"]  # Get field paths from config
-        filters.append(build_wildcard_filter(topicCategory_field, topicCategory_filter))
-    if type_filter:
-        type_field = filter_config["type"]  # Get field paths from config
-        filters.append(build_wildcard_filter(type_field, type_filter))
-    if protocol_filter:
-        protocol_field = filter_config["protocol"]  # Get field paths from config
-        filters.append(build_wildcard_filter(protocol_field, protocol_filter))
-    if mappable_filter:
-        mappable_field = filter_config["mappable"]  # Get field paths from config
-        filters.append(build_wildcard_filter(mappable_field, mappable_filter))
-    if eoCollection_filter:
-        eo_collection_field = filter_config["eo_collection"]  # Get field paths from config
-        filters.append(build_wildcard_filter(eo_collection_field, eoCollection_filter))
-    if polarization_filter:
-        polarization_field = filter_config["polarization"]  # Get field paths from config
-        filters.append(build_wildcard_filter(polarization_field, polarization_filter))
-    if orbit_direction_filter:
-        orbit_direction_field = filter_config["orbit_direction"]  # Get field paths from config
-        filters.append(build_wildcard_filter(orbit_direction_field, orbit_direction_filter))
-   
-    """ Temporal filters """
-    if start_date_filter and end_date_filter:
-        begin_field = filter_config["begin"][0]
-        end_field = filter_config["end"][0]
-        filters.extend(build_date_filter(begin_field, end_field, start_date=start_date_filter, end_date=end_date_filter))
-    elif start_date_filter:
-        begin_field = filter_config["begin"][0]
-        filters.extend(build_date_filter(begin_field, start_date=start_date_filter))
-    elif end_date_filter:
-        end_field = filter_config["end"][0]
-        filters.extend(build_date_filter(end_field, end_date=end_date_filter))
-    
-    """ Spatial filters """
-    if spatial_filter:
-        spatial_field = filter_config["bbox"][0]
-        filters.append(build_spatial_filter(spatial_field, spatial_filter, relation))
-    
-    # Sort param
-    sort_param_final = build_sort_filter(lang_filter, sort_field=sort_param, sort_order=order_param)
-    
-    # If no filters are specified, set filters to None
-    filters = filters if filters else None
-
-    print("filters : ", filters)
-
     ####
     #OpenSearch DashBoard code
     ####
@@ -494,9 +494,6 @@ def lambda_handler(event, context):
     user_agent = event.get('user_agent', '') or ''
     http_method = event.get('http_method', '') or ''
 
-    create_opensearch_index(os_client, search_index_name)
-    ip2geo_data = {}
-    ip2geo_data = ip2geo_handler(os_client, ip_address)
     document = [
         {
             "timestamp": timestamp,
@@ -514,51 +511,181 @@ def lambda_handler(event, context):
             #"end_date_filter": end_date_filter,
             #"spatial_filter": spatial_filter,
             "relation": relation,
-            "size": size,
-            "ip2geo": ip2geo_data
+            "size": size
         }
     ]
 
     print(f"Document to be indexed: {document}")
     
-    save_to_opensearch(os_client, search_index_name, document)
+    # Index check, ip2geo and the bulk write run on the analytics thread, not on the request path
+    with timer.span("analytics_enqueue"):
+        for doc in document:
+            analytics_logger.submit(doc, ip_address)
+    timer.set("analytics", analytics_logger.stats())
 
     ### End of OpenSearch DashBoard code
 
     if event['method'] == 'postText':
         payload = json.loads(event['body'])['text']
-    
+
+    # Empty-query listings may be served from the materialized browse pages (see browse_cache.py)
+    browse = event['method'] == 'SemanticSearch' and not payload and browse_cache.enabled
+
+    # Independent I/O runs concurrently: the index version lookup with building the cache
+    # key, and on a cache miss the query embedding with compiling the filters and the count.
+    # The OpenSearch search itself runs on this thread, bounded by what is left of the deadline
+    deadline_seconds = REQUEST_DEADLINE_SECONDS
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        deadline_seconds = min(deadline_seconds, context.get_remaining_time_in_millis() / 1000 - 1)
+    timer.set("method", event['method'])
+    stages = StageGraph(deadline_seconds=deadline_seconds, timer=timer)
+    stages.add("index_version", lambda: index_versions.get(os_client, model_name))
+    canonical = canonical_request(event, payload)
+    request_key = canonical_request_key(canonical)
+
+    # Repeated requests against the same index version are answered from the response cache
+    index_version = stages.result_or_default("index_version")
+
+    # Cursor paging (paging=cursor on the first page, then the returned cursor) uses a
+    # point-in-time snapshot, so its pages are never served from the response cache
+    cursor_state = None
+    if event['method'] == 'SemanticSearch' and (event.get('cursor') or event.get('paging') == 'cursor'):
+        fingerprint = canonical_request_key({key: value for key, value in canonical.items() if key not in ("from", "cursor", "paging")})
+        try:
+            if event.get('cursor'):
+                cursor_state = decode_cursor(event['cursor'], fingerprint)
+            else:
+                cursor_state = start_cursor(os_client, model_name, fingerprint)
+        except InvalidCursor as e:
+            return error_response(400, e, event, canonical, timer)
+        except CursorLimitExceeded as e:
+            return error_response(429, e, event, canonical, timer)
+        from_param = cursor_state["depth"]
+    # ETag of deployment, index version and canonical request: a matching If-None-Match gets
+    # a 304 without running the search (proxy response mode only)
+    etag = compute_etag(index_version, request_key, ETAG_FINGERPRINT) if cursor_state is None else None
+    if cursor_state is None:
+        if HTTP_RESPONSE_MODE == 'proxy' and etag_matches(request_header(event, 'If-None-Match'), etag):
+            timer.set("response_cache", "not_modified")
+            return not_modified_response(etag, cache_control(canonical, cacheable=True), server_timing_headers(timer))
+
+        if browse:
+            browse_page = browse_cache.get(index_version, canonical)
+            if browse_page is not None:
+                timer.set("response_cache", "browse")
+                return format_response(browse_page, event, canonical, etag, True, timer)
+
+        cached_response = response_cache.get(index_version, request_key)
+        timer.set("response_cache", "hit" if cached_response is not None else "miss")
+        if cached_response is not None:
+            return format_response(cached_response, event, canonical, etag, True, timer)
+    else:
+        timer.set("response_cache", "bypass")
+
+    # Only now, so that 304s and cache hits never call the encoder
+    if event['method'] == 'SemanticSearch':
+        stages.add("embedding", lambda: embed_query(payload, timer))
+
+    # Filters and sort are compiled from the canonical request and memoized per container
+    with timer.span("compile"):
+        filters = compile_filters(filter_ast(canonical))
+        sort_param_final = compile_sort(lang_filter, sort_param, order_param)
+
+    if DEBUG_QUERIES:
+        print("filters : ", filters)
+
+    # Estimate how many documents the filters leave, overlapping with the embedding call
+    if event['method'] == 'SemanticSearch':
+        stages.add("candidates", lambda: estimate_candidates(os_client, model_name, filters, (index_version, filter_ast(canonical))))
+
+    body = None
     if event['method'] == 'SemanticSearch':
         #print(f'This is payload {payload}')
-        
-        features = invoke_sagemaker_endpoint(sagemaker_endpoint, payload, region)
+        features = stages.result_or_default("embedding")
+        knn_strategy = plan_knn(stages.result_or_default("candidates"), timer=timer)
        
-        semantic_search = semantic_search_neighbors(
-            lang=lang_filter,
-            search_text=payload,
-            features=features,
-            os_client=os_client,
-            k_neighbors=k,
-            from_param=from_param,
-            idx_name=model_name,
-            filters=filters,
-            sort_param=sort_param_final,
-            size=size            
-        )
+        try:
+            semantic_search = semantic_search_neighbors(
+                lang=lang_filter,
+                search_text=payload,
+                features=features,
+                os_client=os_client,
+                k_neighbors=knn_k(from_param, size),
+                from_param=from_param,
+                idx_name=model_name,
+                filters=filters,
+                sort_param=sort_param_final,
+                size=size,
+                knn_strategy=knn_strategy,
+                cursor_state=cursor_state,
+                request_timeout=stages.request_timeout(),
+                timer=timer
+            )
+        except InvalidCursor as e:
+            return error_response(400, e, event, canonical, timer)
         
-        return {
+        response = {
             "method": "SemanticSearch", 
             "response": semantic_search
         }         
+        # Serialized once in the proxy mode, for both the cache entry size and the HTTP body
+        if HTTP_RESPONSE_MODE == 'proxy':
+            with timer.span("serialize"):
+                body = json_dumps(response)
     else:
-        search = text_search_keywords(lang_filter, payload, os_client, k, idx_name=model_name)
+        search = text_search_keywords(lang_filter, payload, os_client, k, idx_name=model_name, request_timeout=stages.request_timeout(), timer=timer)
 
-        return {
-            "statusCode": 200,
-            "body": json.dumps({"keyword_response": search}),
-        }
+        with timer.span("serialize"):
+            response = {
+                "statusCode": 200,
+                "body": json_dumps({"keyword_response": search}),
+            }
+
+    timer.set("stages", stages.timings())
+
+    # Don't pin a degraded (no embedding) response in the cache
+    cacheable = event['method'] != 'SemanticSearch' or (features is not None and cursor_state is None)
+    if cacheable:
+        response_cache.put(index_version, request_key, response, size=len(body) if body is not None else None)
+        if browse:
+            browse_cache.put(index_version, canonical, response)
+    return format_response(response, event, canonical, etag, cacheable, timer, body)
+
+def format_response(response, event, canonical, etag, cacheable, timer=None, body=None):
+    """
+    Returns the handler response as is in the legacy mode, or as a proxy response with
+    ETag, Cache-Control and negotiated compression when HTTP_RESPONSE_MODE is 'proxy'.
+    """
+    if HTTP_RESPONSE_MODE != 'proxy':
+        return response
+    with span(timer, "encode"):
+        http_response = build_http_response(response, event, etag if cacheable else None, cache_control(canonical, cacheable), server_timing_headers(timer), body)
+    return http_response
+
+def error_response(status_code, error, event, canonical, timer=None):
+    """
+    A client error: a never cached proxy response with the message, or in the legacy
+    mode a RequestError, since the non-proxy integration would send a returned
+    statusCode with HTTP 200.
+    """
+    if timer:
+        timer.set("error", status_code)
+    if HTTP_RESPONSE_MODE != 'proxy':
+        raise RequestError(status_code, str(error))
+    response = {"statusCode": status_code, "body": json_dumps({"error": str(error)})}
+    return format_response(response, event, canonical, None, False, timer)
+
+def server_timing_headers(timer):
+    """Server-Timing header for a proxy response when SERVER_TIMING_HEADER is on."""
+    if timer is None or not SERVER_TIMING_HEADER:
+        return None
+    # Timing-Allow-Origin lets the cross-origin frontend read the metrics
+    return {"Server-Timing": timer.server_timing(), "Timing-Allow-Origin": "*"}
 
 def language_config(uuid):
+    # Only this rare path needs requests, so it is not imported at init
+    import requests
+
     url = f"https://geocore.api.geo.ca/id/v2?lang=fr&id={uuid}"
 
     try:
@@ -580,3 +707,75 @@ def language_config(uuid):
 
     except requests.exceptions.RequestException as e:
         return {"error": str(e)}
+
+
+def prewarm(queries=None):
+    """
+    Pays the first-request costs of a container up front: the first OpenSearch
+    connection (and the index version of the response cache), the compiled
+    filter_config.json blocks, the analytics index check, the query encoder, the
+    browse cache pages and, when configured, the vectors of the top queries.
+    All of it within PREWARM_SECONDS (see startup.run_prewarm).
+    """
+    deadline = prewarm_deadline()
+    os_client = get_os_client(aos_host, region)
+    queries = prewarm_queries() if queries is None else queries
+
+    def opensearch():
+        version = index_versions.get(os_client, model_name)
+        if version is None:
+            raise RuntimeError(f"Could not resolve index '{model_name}'")
+        return version
+
+    def filter_config():
+        get_filter_config()
+        compile_source_filter()
+        for lang in ("en", "fr"):
+            compile_aggregations(lang)
+
+    def encoder():
+        if ENCODER_MODE == 'local':
+            get_local_encoder()
+        get_sagemaker_client()
+
+    def ip2geo_table():
+        table = get_ip2geo_table()
+        return len(table) if table is not None else None
+
+    def browse_pages():
+        version = index_versions.get(os_client, model_name)
+        if version is None:
+            raise RuntimeError(f"Could not resolve index '{model_name}'")
+        # Left to the first request's background rebuild when it would not finish in time
+        pages = browse_cache.refresh(version, deadline=deadline)
+        if pages is None:
+            raise TimeoutError("browse pages would not be built before the prewarm deadline")
+        return pages
+
+    def top_queries():
+        # Stop at the deadline rather than run past the init phase limit
+        queries_deadline = min(deadline, time.monotonic() + PREWARM_QUERY_SECONDS)
+        embedded = 0
+        for query in queries:
+            if time.monotonic() >= queries_deadline:
+                break
+            if embed_query(query) is not None:
+                embedded += 1
+        return {"embedded": embedded, "configured": len(queries)}
+
+    steps = [
+        ("opensearch", opensearch),
+        ("filter_config", filter_config),
+        ("analytics_index", analytics_logger.ensure_index),
+        ("encoder", encoder),
+        ("ip2geo_table", ip2geo_table)
+    ]
+    if browse_cache.enabled:
+        steps.append(("browse_cache", browse_pages))
+    if queries:
+        steps.append(("top_queries", top_queries))
+    return run_prewarm(steps, deadline)
+
+# The standalone server prewarms once its event loop is bound instead (see main.py)
+if PREWARM_ON_INIT:
+    prewarm()
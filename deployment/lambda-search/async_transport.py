@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import boto3
+
+from os import environ
+from opensearchpy import AsyncOpenSearch, AsyncHttpConnection, AWSV4SignerAsyncAuth
+
+from connection import OS_TIMEOUT, OS_MAX_RETRIES, OS_RETRY_ON_TIMEOUT
+
+# Connections shared by every in-flight request of the process
+OS_ASYNC_POOL_MAXSIZE = int(environ.get('OS_ASYNC_POOL_MAXSIZE', '100'))
+
+
+class AsyncOpenSearchClientManager:
+    """
+    Keeps one AsyncOpenSearch client (one aiohttp connection pool) per host.
+
+    Requests are SigV4-signed for the 'es' service like the AWS4Auth signer of the
+    blocking client. The signer holds the session's refreshable credentials, so
+    rotated credentials are picked up without rebuilding the client.
+    """
+
+    def __init__(self, host, region, service='es', pool_maxsize=OS_ASYNC_POOL_MAXSIZE,
+                 timeout=OS_TIMEOUT, max_retries=OS_MAX_RETRIES, retry_on_timeout=OS_RETRY_ON_TIMEOUT):
+        self.host = host
+        self.region = region
+        self.service = service
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_on_timeout = retry_on_timeout
+
+        self._lock = threading.Lock()
+        self._client = None
+
+    def _build_client(self):
+        credentials = boto3.Session().get_credentials()
+        return AsyncOpenSearch(
+            hosts=[{'host': self.host, 'port': 443}],
+            http_auth=AWSV4SignerAsyncAuth(credentials, self.region, self.service),
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=AsyncHttpConnection,
+            maxsize=self.pool_maxsize,
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            retry_on_timeout=self.retry_on_timeout
+        )
+
+    def get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+                    print(f"Created async OpenSearch client for {self.host} (pool_maxsize={self.pool_maxsize})")
+        return self._client
+
+    async def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            await client.close()
+
+
+class BlockingClient:
+    """
+    Blocking facade over an AsyncOpenSearch client whose I/O runs on an event loop
+    in another thread. Method calls (including namespaced ones such as
+    client.indices.stats) are scheduled on the loop and waited for, so the
+    synchronous search code shares the loop's connection pool unchanged.
+    """
+
+    def __init__(self, target, loop):
+        self._target = target
+        self._loop = loop
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return BlockingClient(attribute, self._loop)
+
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            if not asyncio.iscoroutine(result):
+                return result
+            return run_on_loop(result, self._loop)
+        return call
+
+
+def run_on_loop(coroutine, loop):
+    """Runs a coroutine on loop from another thread and returns its result."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("Blocking OpenSearch call made on the event loop thread, await the async client instead")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+_managers = {}
+
+def bind_event_loop(loop):
+    """Sets the event loop the async clients run on, e.g. the HTTP server's loop."""
+    global _loop
+    _loop = loop
+
+def get_event_loop():
+    """
+    Returns the bound event loop. Without one (on Lambda) a persistent loop is started
+    in a daemon thread on first use and kept for the life of the container.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="opensearch-loop", daemon=True).start()
+                _loop = loop
+                print("Started OpenSearch event loop thread")
+    return _loop
+
+def run_coroutine(coroutine):
+    """Runs a coroutine on the shared event loop from a non-loop thread and returns its result."""
+    return run_on_loop(coroutine, get_event_loop())
+
+def get_async_os_client(host, region):
+    """Returns the process-wide AsyncOpenSearch client for the given host."""
+    key = (host, region)
+    manager = _managers.get(key)
+    if manager is None:
+        manager = _managers.setdefault(key, AsyncOpenSearchClientManager(host, region))
+    return manager.get_client()
+
+def get_blocking_os_client(host, region):
+    """Returns a blocking client backed by the async client of the shared event loop."""
+    return BlockingClient(get_async_os_client(host, region), get_event_loop())
+
+async def close_async_clients():
+    for manager in list(_managers.values()):
+        await manager.close()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark of search response building and serialization on a synthetic 100-hit response.
+
+    python bench_response.py [--hits 100] [--repeat 200]
+"""
+import json
+import time
+import random
+import argparse
+
+from response_builder import create_api_response_geojson, json_dumps, orjson
+
+
+def legacy_create_api_response_geojson(search_results, lang):
+    """The previous builder: copies each _source and rebuilds it twice, kept here as the baseline."""
+    def add_to_top_of_dict(original_dict, key, value):
+        if key is None or value is None:
+            return original_dict
+        new_dict = {key: value}
+        new_dict.update(original_dict)
+        return new_dict
+
+    response = {
+        "total_hits": search_results['hits']['total']['value'] if 'total' in search_results['hits'] else 0,
+        "returned_hits": len(search_results['hits']['hits']),
+        "aggs": search_results.get("aggregations", {}),
+        "items": []
+    }
+    for count, hit in enumerate(search_results['hits']['hits'], start=1):
+        source_data = hit['_source'].copy()
+        source_data.pop('vector', None)
+        source_data = add_to_top_of_dict(source_data, 'relevancy', hit.get('_score', ''))
+        source_data = add_to_top_of_dict(source_data, 'row_num', count)
+        geometry = source_data.get('coordinates')
+        source_data.pop('coordinates')
+        response["items"].append({
+            "type": "FeatureCollection",
+            "features": [{"type": "Feature", "geometry": geometry, "properties": source_data}]
+        })
+    return response
+
+def synthetic_search_results(hits=100, with_vector=False, seed=7):
+    """An OpenSearch-shaped response with polygon geometries and 7 facet aggregations."""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(hits):
+        west, south = rng.uniform(-140, -60), rng.uniform(42, 80)
+        source = {
+            "id": f"{i:08d}-0000-0000-0000-000000000000",
+            "coordinates": {
+                "type": "Polygon",
+                "coordinates": [[[west, south], [west + 2, south], [west + 2, south + 2], [west, south + 2], [west, south]]]
+            },
+            "title": f"Synthetic record {i} wildfire burned area",
+            "description": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8,
+            "published": "2021-06-01",
+            "keywords": "wildfire, forest, burned area, remote sensing",
+            "options": [{"url": f"https://example.com/{i}", "protocol": "OGC:WMS", "name": {"en": "WMS", "fr": "WMS"}}],
+            "contact": [{"organisation": {"en": "Natural Resources Canada", "fr": "Ressources naturelles Canada"}}],
+            "topicCategory": "imageryBaseMapsEarthCover",
+            "type": "dataset",
+            "temporalExtent": {"begin": "2020-01-01", "end": "2021-01-01"},
+            "popularity": rng.randint(0, 5000),
+            "systemName": "geonetwork"
+        }
+        if with_vector:
+            source["vector"] = [rng.uniform(-1, 1) for _ in range(768)]
+        documents.append({"_index": "mpnet-mpf-knn", "_id": str(i), "_score": rng.random(), "_source": source})
+
+    aggregations = {
+        name: {"buckets": [{"key": f"{name}-{b}", "doc_count": rng.randint(1, 999)} for b in range(20)]}
+        for name in ["unique_mappable", "unique_protocol", "unique_org", "unique_source_system",
+                     "unique_eo_collection", "unique_topic_category", "unique_theme"]
+    }
+    return {"took": 12, "hits": {"total": {"value": 4321, "relation": "eq"}, "hits": documents}, "aggregations": aggregations}
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main(hits, repeat):
+    for with_vector in (False, True):
+        results = synthetic_search_results(hits, with_vector=with_vector)
+        assert legacy_create_api_response_geojson(results, "en") == create_api_response_geojson(results, "en")
+
+        label = "with vector in _source" if with_vector else "vector excluded"
+        print(f"{hits} hits, {label}:")
+        print(f"  legacy build         {timed(lambda: legacy_create_api_response_geojson(results, 'en'), repeat):8.3f} ms")
+        print(f"  single-pass build    {timed(lambda: create_api_response_geojson(results, 'en'), repeat):8.3f} ms")
+
+        response = create_api_response_geojson(results, "en")
+        print(f"  json.dumps           {timed(lambda: json.dumps(response), repeat):8.3f} ms")
+        if orjson is not None:
+            print(f"  orjson               {timed(lambda: json_dumps(response), repeat):8.3f} ms")
+        else:
+            print("  orjson               not installed")
+        print(f"  body size            {len(json_dumps(response)) / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark search response building.')
+    parser.add_argument('--hits', type=int, default=100, help='Number of hits in the synthetic response')
+    parser.add_argument('--repeat', type=int, default=200, help='Iterations per measurement')
+    args = parser.parse_args()
+
+    main(hits=args.hits, repeat=args.repeat)
@@ -0,0 +1,254 @@
+"""
+End-to-end benchmark of lambda_handler against local stand-ins for SageMaker and OpenSearch.
+
+Replays request events through the handler with a fake SageMaker runtime (deterministic
+vectors) and a fake OpenSearch (_search, _msearch, _count, _simulate, index checks and
+writes), each with a configurable latency, and reports latency percentiles, throughput
+and the per-stage breakdown from the request timing records.
+
+    python bench_search.py [--events event.json events.jsonl] [--requests 500] [--concurrency 8]
+                           [--sagemaker_ms 40] [--opensearch_ms 25] [--caches]
+"""
+import io
+import os
+import sys
+import copy
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_response import synthetic_search_results
+
+BENCH_ENVIRONMENT = {
+    "MY_AWS_REGION": "ca-central-1",
+    "OS_ENDPOINT": "opensearch.bench.local",
+    "SAGEMAKER_ENDPOINT": "bench-endpoint",
+    "OS_SECRET_ID": "bench/secret",
+    "MODEL_NAME": "mpnet-mpf-knn",
+    "NEW_INDEX_NAME": "bench-search-logs",
+    "OS_TRANSPORT": "sync",
+    "ENCODER_MODE": "sagemaker",
+    "SHARED_EMBEDDING_CACHE": "",
+    "TIMING_LOG": "false"
+}
+
+# Replayed when no --events are given: semantic, filtered, browse and keyword requests
+SAMPLE_EVENTS = [
+    {"method": "SemanticSearch", "q": "wildfire", "lang": "en", "size": 10, "from": 0},
+    {"method": "SemanticSearch", "q": "flood risk maps", "lang": "en", "size": 10, "from": 10},
+    {"method": "SemanticSearch", "q": "sentinel-1 imagery", "lang": "en", "type": "dataset", "theme": "imagery",
+     "bbox": "-95.1562,41.6766,-74.3436,56.8562", "relation": "intersects", "size": 20, "from": 0},
+    {"method": "SemanticSearch", "q": "qualité de l'eau", "lang": "fr", "sort": "date", "order": "desc", "size": 10, "from": 0},
+    {"method": "SemanticSearch", "q": "", "lang": "en", "size": 10, "from": 0},
+    {"method": "KeywordSearch", "q": "elevation", "lang": "en"}
+]
+
+
+class FakeSageMakerRuntime:
+    """invoke_endpoint returning a deterministic 768-dimension vector per query after a fixed latency."""
+
+    def __init__(self, latency_ms, dimension=768):
+        self.latency = latency_ms / 1000
+        self.dimension = dimension
+        self.calls = 0
+
+    def invoke_endpoint(self, EndpointName, ContentType, Body):
+        self.calls += 1
+        time.sleep(self.latency)
+        rng = random.Random(hashlib.sha256(Body.encode("utf-8")).digest())
+        vector = [rng.uniform(-1, 1) for _ in range(self.dimension)]
+        return {"Body": io.BytesIO(json.dumps(vector).encode("utf-8"))}
+
+
+class FakeOpenSearch:
+    """The OpenSearch client calls made by the search Lambda, answered from a synthetic corpus."""
+
+    def __init__(self, latency_ms, hits=100):
+        self.latency = latency_ms / 1000
+        self.results = synthetic_search_results(hits)
+        for hit in self.results["hits"]["hits"]:
+            hit["sort"] = [hit["_score"], hit["_source"]["id"]]
+        self.indices = SimpleNamespace(
+            exists=lambda index, **kwargs: self._answer(True),
+            create=lambda index, body=None, **kwargs: self._answer({"acknowledged": True}),
+            stats=lambda index, **kwargs: self._answer({"indices": {index: {"uuid": "bench-uuid", "primaries": {
+                "docs": {"count": len(self.results["hits"]["hits"])}, "indexing": {"index_total": 0, "delete_total": 0}
+            }}}})
+        )
+        self.transport = SimpleNamespace(perform_request=self._perform_request)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _answer(self, response, call=None):
+        if call:
+            with self._lock:
+                self.calls[call] = self.calls.get(call, 0) + 1
+        time.sleep(self.latency)
+        return response
+
+    def _page(self, body):
+        size = int((body or {}).get("size", 10))
+        start = int((body or {}).get("from", 0))
+        hits = self.results["hits"]["hits"][start:start + size]
+        response = dict(self.results, took=max(1, int(self.latency * 1000 * 0.8)))
+        response["hits"] = dict(self.results["hits"], hits=hits)
+        if "pit" in (body or {}):
+            response["pit_id"] = body["pit"]["id"]
+        return response
+
+    def search(self, body=None, index=None, **kwargs):
+        return self._answer(self._page(body), "search")
+
+    def msearch(self, body, **kwargs):
+        return self._answer({"took": 1, "responses": [self._page(query) for query in body[1::2]]}, "msearch")
+
+    def count(self, index=None, body=None, **kwargs):
+        return self._answer({"count": self.results["hits"]["total"]["value"]}, "count")
+
+    def create_point_in_time(self, index, keep_alive, **kwargs):
+        return self._answer({"pit_id": "bench-pit"}, "create_point_in_time")
+
+    def delete_point_in_time(self, body=None, **kwargs):
+        return self._answer({"pits": [{"pit_id": pit_id, "successful": True} for pit_id in body["pit_id"]]}, "delete_point_in_time")
+
+    def bulk(self, body, **kwargs):
+        return self._answer({"errors": False, "items": []}, "bulk")
+
+    def index(self, index, body, **kwargs):
+        return self._answer({"result": "created"}, "index")
+
+    def _perform_request(self, method, url, body=None, **kwargs):
+        simulated = {"docs": [{"doc": {"_source": {"ip2geo": {"country_iso_code": "CA", "location": "45.4,-75.7"}}}}]}
+        return self._answer(simulated, "simulate")
+
+
+def load_events(paths):
+    """Events from .json files (one event or a list) and .jsonl files (one per line, optionally under 'event')."""
+    events = []
+    for path in paths:
+        with open(path, "r") as file:
+            if path.endswith(".jsonl"):
+                records = [json.loads(line) for line in file if line.strip()]
+            else:
+                records = json.load(file)
+                records = records if isinstance(records, list) else [records]
+        events.extend(record.get("event", record) for record in records)
+    return events
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "mean": sum(values) / len(values)
+    }
+
+
+def run(app, events, requests, concurrency, warmup):
+    """Replays events round-robin through the handler and returns (latencies_ms, timing records, wall seconds)."""
+    from timing import timing_listeners
+
+    records = []
+    errors = {}
+    timing_listeners.append(records.append)
+
+    def invoke(i):
+        event = copy.deepcopy(events[i % len(events)])
+        event.setdefault("ip_address", f"10.0.{i % 256}.1")
+        start = time.perf_counter()
+        try:
+            app.lambda_handler(event, None)
+        except Exception as e:
+            message = f"{type(e).__name__}: {e}"
+            errors[message] = errors.get(message, 0) + 1
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(invoke, range(warmup)))
+        del records[:]
+        wall_start = time.perf_counter()
+        errors.clear()
+        latencies = list(pool.map(invoke, range(requests)))
+        wall = time.perf_counter() - wall_start
+
+    timing_listeners.remove(records.append)
+    return latencies, records, errors, wall
+
+def report(latencies, records, errors, wall, concurrency, sagemaker, opensearch):
+    print(f"{len(latencies)} requests, concurrency {concurrency}, {wall:.2f} s, {len(latencies) / wall:.1f} req/s")
+    stats = summarize(latencies)
+    print(f"latency ms   p50 {stats['p50']:8.2f}   p95 {stats['p95']:8.2f}   p99 {stats['p99']:8.2f}   mean {stats['mean']:8.2f}")
+
+    spans = {}
+    for record in records:
+        for name, duration in record["timing"].items():
+            spans.setdefault(name, []).append(duration)
+    print(f"\n{'stage':<20} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}")
+    for name, durations in sorted(spans.items(), key=lambda item: -sum(item[1])):
+        stats = summarize(durations)
+        print(f"{name:<20} {len(durations):>6} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f} {stats['mean']:>9.2f}")
+
+    outcomes = {}
+    for record in records:
+        outcome = record.get("response_cache", "-")
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    print(f"\nresponse cache: {outcomes}")
+    print(f"sagemaker calls: {sagemaker.calls}, opensearch calls: {opensearch.calls}")
+    for message, count in errors.items():
+        print(f"failed requests: {count} x {message}")
+
+
+def main(args):
+    for key, value in BENCH_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    if not args.caches:
+        # Every request pays the full path unless caching is being measured
+        os.environ.setdefault("RESPONSE_CACHE_TTL", "0")
+        os.environ.setdefault("EMBEDDING_CACHE_TTL", "0")
+        os.environ.setdefault("BROWSE_CACHE_PAGES", "0")
+    else:
+        os.environ.setdefault("BROWSE_CACHE_PAGES", "3")
+
+    import app
+
+    sagemaker = FakeSageMakerRuntime(args.sagemaker_ms)
+    opensearch = FakeOpenSearch(args.opensearch_ms, hits=args.hits)
+    app.boto3 = SimpleNamespace(client=lambda service, region_name=None: sagemaker)
+    app.get_os_client = lambda host, region: opensearch
+
+    events = load_events(args.events) if args.events else SAMPLE_EVENTS
+    output = sys.stdout if args.verbose else io.StringIO()
+    with redirect_stdout(output):
+        latencies, records, errors, wall = run(app, events, args.requests, args.concurrency, args.warmup)
+        app.analytics_logger.flush(timeout=10)
+
+    source = ", ".join(args.events) if args.events else "the sample events"
+    print(f"{len(events)} event(s) from {source}; sagemaker {args.sagemaker_ms} ms, opensearch {args.opensearch_ms} ms")
+    report(latencies, records, errors, wall, args.concurrency, sagemaker, opensearch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark lambda_handler against local SageMaker and OpenSearch stand-ins.')
+    parser.add_argument('--events', type=str, nargs='+', help='Event files (.json or .jsonl), e.g. event.json; defaults to SAMPLE_EVENTS')
+    parser.add_argument('--requests', type=int, default=500, help='Measured requests')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests run first')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent invocations')
+    parser.add_argument('--sagemaker_ms', type=float, default=40, help='Fake SageMaker latency')
+    parser.add_argument('--opensearch_ms', type=float, default=25, help='Fake OpenSearch latency per call')
+    parser.add_argument('--hits', type=int, default=100, help='Documents in the fake corpus')
+    parser.add_argument('--caches', action='store_true', help='Keep the response and embedding caches on and materialize 3 browse pages')
+    parser.add_argument('--verbose', action='store_true', help='Show the handler output')
+
+    main(parser.parse_args())
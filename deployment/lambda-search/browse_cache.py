@@ -0,0 +1,169 @@
+import json
+import time
+import threading
+
+from os import environ
+from cache import LIST_FILTER_PARAMS, canonical_request, canonical_request_key
+
+# First pages of the empty-query listing materialized per container; 0 (the default) disables the browse cache
+BROWSE_CACHE_PAGES = int(environ.get('BROWSE_CACHE_PAGES', '0'))
+BROWSE_CACHE_PAGE_SIZE = int(environ.get('BROWSE_CACHE_PAGE_SIZE', '10'))
+# Age after which the pages are rebuilt in the background; an index version change rebuilds them at once
+BROWSE_CACHE_REFRESH_SECONDS = int(environ.get('BROWSE_CACHE_REFRESH_SECONDS', '300'))
+# Lambda freezes a container between invocations, so a background rebuild would stall there.
+# On Lambda a missing or expired page is instead replaced by the response of the request
+# that searched it (see BrowseCache.put).
+BROWSE_CACHE_BACKGROUND = environ.get(
+    'BROWSE_CACHE_BACKGROUND', 'false' if 'AWS_LAMBDA_FUNCTION_NAME' in environ else 'true'
+).lower() == 'true'
+# Single-filter listings materialized besides the unfiltered one, e.g. 'type=dataset|theme=imagery'
+BROWSE_CACHE_FILTERS = environ.get('BROWSE_CACHE_FILTERS', '')
+BROWSE_CACHE_LANGS = ["en", "fr"]
+
+
+def browse_filters(filters=BROWSE_CACHE_FILTERS):
+    """Parses 'param=value|...' into (param, value) pairs, skipping parameters that are not list filters."""
+    selections = []
+    for entry in filters.split("|") if filters else []:
+        param, _, value = entry.partition("=")
+        param, value = param.strip(), value.strip()
+        if param not in LIST_FILTER_PARAMS or not value:
+            print(f"Ignoring browse cache filter '{entry}', expected one of {LIST_FILTER_PARAMS}=value")
+            continue
+        selections.append((param, value))
+    return selections
+
+def browse_canonicals(pages, page_size, selections, langs):
+    """Canonical requests (see cache.canonical_request) of every materialized page."""
+    for lang in langs:
+        for selection in [None] + selections:
+            for page in range(pages):
+                event = {
+                    "method": "SemanticSearch", "q": "", "lang": lang, "sort": "popularity",
+                    "order": "desc", "from": page * page_size, "size": page_size
+                }
+                if selection:
+                    event[selection[0]] = selection[1]
+                yield canonical_request(event, "")
+
+def browse_request_key(canonical):
+    """Cache key of a listing page. An empty order is the default desc, so both share a page."""
+    return canonical_request_key(dict(canonical, order=canonical.get("order") or "desc"))
+
+
+class BrowseCache:
+    """
+    Materialized pages of the empty-query listing (the landing page), sorted by popularity.
+
+    build_page(canonical, index_version) runs the search of one page. The first pages of
+    the unfiltered listing and of the configured single-filter listings are built for
+    both languages, facets included, and matching requests are answered from them
+    without a search. The pages belong to one index version: a request seeing another
+    version starts a rebuild and goes to the cluster meanwhile. Pages older than
+    refresh_seconds are still served while a background rebuild replaces them.
+
+    Without background rebuilds (on Lambda) the rebuild is inline and costs no extra
+    search: pages of another index version or older than refresh_seconds are misses,
+    and put() stores the response of the request that then went to the cluster.
+    refresh() still builds them all at once, e.g. from the prewarm.
+    """
+
+    def __init__(self, build_page, pages=BROWSE_CACHE_PAGES, page_size=BROWSE_CACHE_PAGE_SIZE,
+                 selections=None, langs=BROWSE_CACHE_LANGS, refresh_seconds=BROWSE_CACHE_REFRESH_SECONDS,
+                 background=BROWSE_CACHE_BACKGROUND):
+        self.build_page = build_page
+        self.pages = pages
+        self.page_size = page_size
+        self.selections = browse_filters() if selections is None else selections
+        self.langs = langs
+        self.refresh_seconds = refresh_seconds
+        self.background = background
+        self.enabled = pages > 0
+
+        self._keys = {browse_request_key(canonical) for canonical in browse_canonicals(pages, page_size, self.selections, langs)}
+        # Request key -> (time.monotonic() when built, response), all for self._version
+        self._entries = {}
+        self._version = None
+        self._built_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.last_refresh_ms = None
+
+    def get(self, index_version, canonical):
+        """The materialized response of a request, or None when it is not (yet) materialized."""
+        if not self.enabled or index_version is None:
+            return None
+        now = time.monotonic()
+        entry = self._entries.get(browse_request_key(canonical)) if index_version == self._version else None
+        if self.background:
+            if index_version != self._version or now - self._built_at > self.refresh_seconds:
+                self.refresh_async(index_version)
+        elif entry is not None and now - entry[0] > self.refresh_seconds:
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, index_version, canonical, response):
+        """
+        Stores the searched response of a materialized page, replacing the pages of an
+        older index version. Requests for other pages are ignored.
+        """
+        key = browse_request_key(canonical)
+        if not self.enabled or index_version is None or key not in self._keys:
+            return
+        with self._lock:
+            if index_version != self._version:
+                self._entries = {}
+                self._version = index_version
+                self._built_at = time.monotonic()
+            self._entries[key] = (time.monotonic(), response)
+
+    def refresh(self, index_version, deadline=None):
+        """
+        Builds every page for index_version, then swaps them in. Returns the number of pages built.
+        With a deadline (a time.monotonic() value) the rebuild is abandoned, keeping the current
+        pages, as soon as building the next page at the average pace would pass it; then None
+        is returned.
+        """
+        start = time.perf_counter()
+        entries = {}
+        for built, canonical in enumerate(browse_canonicals(self.pages, self.page_size, self.selections, self.langs)):
+            if deadline is not None:
+                page_seconds = (time.perf_counter() - start) / built if built else 0.0
+                if time.monotonic() + page_seconds >= deadline:
+                    print(json.dumps({"browse_cache_refresh": {"index_version": index_version, "abandoned_after_pages": built}}))
+                    return None
+            try:
+                entries[browse_request_key(canonical)] = (time.monotonic(), self.build_page(canonical, index_version))
+            except Exception as e:
+                print(f"Error building browse page {canonical}: {e}")
+        with self._lock:
+            self._entries = entries
+            self._version = index_version
+            self._built_at = time.monotonic()
+        self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(json.dumps({"browse_cache_refresh": {"index_version": index_version, "pages": len(entries), "ms": self.last_refresh_ms}}))
+        return len(entries)
+
+    def refresh_async(self, index_version):
+        """Starts a background refresh unless one is already running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(index_version)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        threading.Thread(target=run, name="browse-cache-refresh", daemon=True).start()
+
+    def stats(self):
+        return {"pages": len(self._entries), "hits": self.hits, "misses": self.misses, "last_refresh_ms": self.last_refresh_ms}
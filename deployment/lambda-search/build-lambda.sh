@@ -5,9 +5,20 @@ cd ~/environment/semantic-search-invoke-pretrain-all-MiniLM-L6-v2-dev/hello_worl
 # Example for Python Lambda functions: Install dependencies into the current directory
 pip install -r requirements.txt -t ./package/
 
+# Optional: aiohttp for OS_TRANSPORT=async only. opensearch-py imports it at init whenever it is installed
+if [ "$OS_TRANSPORT" = "async" ]; then
+    pip install -r requirements-async.txt -t ./package/
+fi
+
+# Optional: in-process query encoder (ENCODER_MODE=local). Export it with src/export_onnx_encoder.py first
+if [ -d encoder ]; then
+    pip install -r requirements-local-encoder.txt -t ./package/
+    cp -r encoder package/
+fi
+
 
 #Add your Lambda function code to the package directory
-cp app.py package/
+cp app.py async_transport.py browse_cache.py cache.py connection.py dashboard.py filter_builder.py fusion.py http_response.py local_encoder.py pagination.py planner.py query_compiler.py response_builder.py stages.py startup.py timing.py vector_store.py filter_config.json package/
 cd package 
 
 # Create a zip file named lambda-function.zip including all files and directories in the current directory
@@ -0,0 +1,281 @@
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+
+EMBEDDING_CACHE_SIZE = int(environ.get('EMBEDDING_CACHE_SIZE', '2048'))
+EMBEDDING_CACHE_TTL = int(environ.get('EMBEDDING_CACHE_TTL', '3600'))
+RESPONSE_CACHE_SIZE = int(environ.get('RESPONSE_CACHE_SIZE', '256'))
+RESPONSE_CACHE_MAX_BYTES = int(environ.get('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = int(environ.get('RESPONSE_CACHE_TTL', '60'))
+INDEX_VERSION_TTL = int(environ.get('INDEX_VERSION_TTL', '30'))
+
+# Event parameters holding comma-separated, order-independent filter values
+LIST_FILTER_PARAMS = [
+    "org", "source_system", "theme", "topic_category", "type", "protocol", "mappable",
+    "eo_collection", "polarization", "orbit_direction", "foundational"
+]
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+
+    Entries are evicted least-recently-used first once max_entries (or, when set,
+    max_bytes of caller-reported entry sizes) is exceeded, and are treated as
+    missing once they are older than ttl seconds.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, max_bytes=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = self._clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value, size = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._bytes -= size
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None, size=0):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def normalize_query(text):
+    """
+    Normalizes query text for cache keys: Unicode NFKC, trimmed, whitespace collapsed, case-folded.
+    """
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(text))
+    return ' '.join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """
+    In-process cache of query embeddings keyed on (model, endpoint, normalized query).
+
+    Vectors are held as float32 arrays to keep the memory bound predictable. The
+    whole cache is dropped when the model name or SageMaker endpoint changes.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._generation = None
+
+    def _check_generation(self, model_name, endpoint):
+        generation = (model_name, endpoint)
+        if generation != self._generation:
+            if self._generation is not None:
+                print(f"Embedding model changed from {self._generation} to {generation}, clearing embedding cache")
+            self._cache.clear()
+            self._generation = generation
+
+    def get(self, model_name, endpoint, query):
+        self._check_generation(model_name, endpoint)
+        vector = self._cache.get(normalize_query(query))
+        return vector.tolist() if vector is not None else None
+
+    def put(self, model_name, endpoint, query, vector):
+        self._check_generation(model_name, endpoint)
+        self._cache.put(normalize_query(query), array('f', vector))
+
+    def stats(self):
+        return self._cache.stats()
+
+
+embedding_cache = EmbeddingCache()
+
+
+def _canonical_list(value):
+    values = {v.strip().lower() for v in str(value).split(",") if v.strip()}
+    return sorted(values)
+
+def _canonical_bbox(bbox):
+    try:
+        return [round(float(v), 6) for v in str(bbox).split(",") if v.strip()]
+    except ValueError:
+        return str(bbox).strip()
+
+def _canonical_int(value, default):
+    return int(value) if value is not None and str(value).isdigit() else default
+
+def canonical_lang(value):
+    """Request language as used for the query, the response and the cache key: 'en' when empty."""
+    return (str(value or '').strip() or 'en').lower()
+
+def canonical_request(event, payload=None):
+    """
+    Reduces a search event to the parameters that determine its response, in a
+    stable form: filter values de-duplicated and sorted, bbox and dates normalized,
+    defaults filled in. Request metadata (IP, user agent, timestamp) is ignored.
+    """
+    query = payload if payload is not None else event.get('q', '')
+    canonical = {
+        "method": event.get('method', ''),
+        "q": normalize_query(query),
+        "lang": canonical_lang(event.get('lang')),
+        "sort": (event.get('sort') or 'relevancy').lower(),
+        "order": (event.get('order', 'desc') or '').lower(),
+        "from": _canonical_int(event.get('from'), 0),
+        "size": _canonical_int(event.get('size'), 10),
+    }
+    for param in LIST_FILTER_PARAMS:
+        if event.get(param):
+            canonical[param] = _canonical_list(event[param])
+    for param in ("begin", "end"):
+        if event.get(param):
+            canonical[param] = str(event[param]).strip().lower()
+    for param in ("paging", "cursor"):
+        if event.get(param):
+            canonical[param] = str(event[param])
+    if event.get('bbox'):
+        canonical["bbox"] = _canonical_bbox(event['bbox'])
+        canonical["relation"] = (event.get('relation') or 'intersects').lower()
+    return canonical
+
+def canonical_request_key(canonical):
+    """SHA-256 of a canonical request (see canonical_request), usable as a cache key."""
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def index_version_token(name, stats):
+    """'name:uuid:docs.indexed.deleted' of one index from its _stats entry."""
+    primaries = stats["primaries"]
+    counts = (primaries["docs"]["count"], primaries["indexing"]["index_total"], primaries["indexing"]["delete_total"])
+    return f"{name}:{stats.get('uuid', '')}:" + ".".join(str(count) for count in counts)
+
+
+class IndexVersionTracker:
+    """
+    Resolves an index (or alias) to a version token of concrete index name, uuid and
+    primary document and write counts.
+
+    Recreating the index during a reindex changes its uuid, and indexing, updating or
+    deleting documents changes the counts, so any cache (and ETag) keyed on the token
+    is busted. The lookup itself is cached for INDEX_VERSION_TTL seconds, which bounds
+    how long a response can outlive a change of the documents.
+    """
+
+    def __init__(self, ttl=INDEX_VERSION_TTL):
+        self._cache = TTLCache(max_entries=16, ttl=ttl)
+
+    def get(self, os_client, index):
+        version = self._cache.get(index)
+        if version is None:
+            try:
+                stats = os_client.indices.stats(index=index, metric="docs,indexing")
+                version = ",".join(
+                    index_version_token(name, body) for name, body in sorted(stats["indices"].items())
+                )
+            except Exception as e:
+                print(f"Error resolving index version for {index}: {e}")
+                return None
+            self._cache.put(index, version)
+        return version
+
+
+class ResponseCache:
+    """
+    Cache of complete search responses keyed by index version and canonical request.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL):
+        self.enabled = ttl > 0
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+
+    def get(self, index_version, request_key):
+        if not self.enabled or index_version is None:
+            return None
+        return self._cache.get((index_version, request_key))
+
+    def put(self, index_version, request_key, response, size=None):
+        """
+        Caches a response with its serialized size, given by the caller that already has the
+        body or read from a {"statusCode", "body"} response. Payload dicts of unknown size are
+        measured and stored on the cache's sizer thread, off the request path.
+        """
+        if not self.enabled or index_version is None:
+            return
+        if size is None and isinstance(response.get("body"), str):
+            size = len(response["body"])
+        if size is None:
+            global _sizer
+            with _sizer_lock:
+                if _sizer is None:
+                    _sizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+            _sizer.submit(self._put_measured, (index_version, request_key), response)
+            return
+        self._cache.put((index_version, request_key), response, size=size)
+
+    def _put_measured(self, key, response):
+        self._cache.put(key, response, size=len(json.dumps(response, separators=(",", ":"), default=str)))
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# One sizer thread for responses cached without a known size, started by the first such put
+_sizer = None
+_sizer_lock = threading.Lock()
+
+
+index_versions = IndexVersionTracker()
+response_cache = ResponseCache()
@@ -0,0 +1,116 @@
+import threading
+import boto3
+
+from os import environ
+from opensearchpy import OpenSearch, RequestsHttpConnection
+from requests_aws4auth import AWS4Auth
+
+# Connection pool settings, overridable from the Lambda environment
+OS_POOL_MAXSIZE = int(environ.get('OS_POOL_MAXSIZE', '10'))
+OS_TIMEOUT = int(environ.get('OS_TIMEOUT', '55'))
+OS_MAX_RETRIES = int(environ.get('OS_MAX_RETRIES', '3'))
+OS_RETRY_ON_TIMEOUT = environ.get('OS_RETRY_ON_TIMEOUT', 'false').lower() == 'true'
+# 'sync' uses RequestsHttpConnection, 'async' sends the calls through the shared
+# AsyncOpenSearch client of an event loop (see async_transport.py), which needs
+# requirements-async.txt (build-lambda.sh installs it when OS_TRANSPORT=async)
+OS_TRANSPORT = environ.get('OS_TRANSPORT', 'sync')
+
+
+class OpenSearchClientManager:
+    """
+    Keeps one pooled OpenSearch client per Lambda container.
+
+    The client (and its keep-alive HTTP connections) is created on first use and
+    reused by every later invocation on the same warm container. The SigV4 signer
+    is only rebuilt when the session credentials rotate.
+    """
+
+    def __init__(self, host, region, service='es', pool_maxsize=OS_POOL_MAXSIZE,
+                 timeout=OS_TIMEOUT, max_retries=OS_MAX_RETRIES, retry_on_timeout=OS_RETRY_ON_TIMEOUT):
+        self.host = host
+        self.region = region
+        self.service = service
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_on_timeout = retry_on_timeout
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._client = None
+        self._auth = None
+        self._credential_key = None
+
+    def _current_credentials(self):
+        if self._session is None:
+            self._session = boto3.Session()
+        # Refreshable credentials are refreshed by botocore when they near expiry
+        return self._session.get_credentials().get_frozen_credentials()
+
+    def _build_auth(self, credentials):
+        return AWS4Auth(credentials.access_key, credentials.secret_key, self.region, self.service,
+                        session_token=credentials.token)
+
+    def _build_client(self, auth):
+        return OpenSearch(
+            hosts=[{'host': self.host, 'port': 443}],
+            http_auth=auth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=RequestsHttpConnection,
+            pool_maxsize=self.pool_maxsize,
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            retry_on_timeout=self.retry_on_timeout
+        )
+
+    def _swap_auth(self, auth):
+        """Point the existing pooled connections at a new signer without reconnecting."""
+        for connection in self._client.transport.connection_pool.connections:
+            connection.session.auth = auth
+        self._client.transport.kwargs['http_auth'] = auth
+
+    def get_client(self):
+        """Return the shared client, creating it or re-signing it only when needed."""
+        credentials = self._current_credentials()
+        credential_key = (credentials.access_key, credentials.token)
+
+        if self._client is not None and credential_key == self._credential_key:
+            return self._client
+
+        with self._lock:
+            if self._client is None:
+                self._auth = self._build_auth(credentials)
+                self._client = self._build_client(self._auth)
+                print(f"Created pooled OpenSearch client for {self.host} (pool_maxsize={self.pool_maxsize})")
+            elif credential_key != self._credential_key:
+                self._auth = self._build_auth(credentials)
+                self._swap_auth(self._auth)
+                print("AWS credentials rotated, refreshed OpenSearch request signer")
+            self._credential_key = credential_key
+
+        return self._client
+
+    def reset(self):
+        """Drop the cached client, e.g. after an unrecoverable connection error."""
+        with self._lock:
+            self._client = None
+            self._auth = None
+            self._credential_key = None
+
+
+_managers = {}
+
+def get_os_client(host, region):
+    """
+    Returns the container-wide OpenSearch client for the given host.
+    """
+    if OS_TRANSPORT == 'async':
+        from async_transport import get_blocking_os_client
+        return get_blocking_os_client(host, region)
+
+    key = (host, region)
+    manager = _managers.get(key)
+    if manager is None:
+        manager = _managers.setdefault(key, OpenSearchClientManager(host, region))
+    return manager.get_client()
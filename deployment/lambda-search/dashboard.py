@@ -1,4 +1,23 @@
+import csv
 import json
+import time
+import queue
+import bisect
+import threading
+import ipaddress
+
+from os import environ
+from cache import TTLCache
+from startup import LEAN_STARTUP
+
+ANALYTICS_QUEUE_SIZE = int(environ.get('ANALYTICS_QUEUE_SIZE', '1000'))
+ANALYTICS_BATCH_SIZE = int(environ.get('ANALYTICS_BATCH_SIZE', '50'))
+# Window over which search logs are batched into one bulk write
+ANALYTICS_FLUSH_INTERVAL = float(environ.get('ANALYTICS_FLUSH_INTERVAL', '1.0'))
+IP2GEO_CACHE_SIZE = int(environ.get('IP2GEO_CACHE_SIZE', '4096'))
+IP2GEO_CACHE_TTL = int(environ.get('IP2GEO_CACHE_TTL', '86400'))
+IP2GEO_DB_PATH = environ.get('IP2GEO_DB_PATH', '')
+IP2GEO_SIMULATE_URL = "/_ingest/pipeline/ip-to-geo-pipeline/_simulate"
 
 def parse_geo_point(ip2geo_data):
     if 'location' in ip2geo_data and isinstance(ip2geo_data['location'], str):
@@ -10,8 +29,119 @@ def parse_geo_point(ip2geo_data):
             ip2geo_data['location'] = None  # Handle errors gracefully
     return ip2geo_data
 
+def ip2geo_cache_key(ip_address):
+    """
+    Cache key for an IP: its /24 network for IPv4 (geolocation is not finer than that),
+    the address itself otherwise.
+    """
+    try:
+        ip = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return ip_address
+    if ip.version == 4:
+        return str(ipaddress.ip_network(f"{ip}/24", strict=False))
+    return str(ip)
+
+
+class IPRangeTable:
+    """
+    Offline IP geolocation from a sorted table of address ranges.
+
+    The CSV has a header row with start_ip and end_ip columns followed by ip2geo
+    fields (country_iso_code, country_name, region_name, city_name, location, ...).
+    Ranges must not overlap. Lookups are a binary search, with no network call.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row[0])
+        self._starts = [row[0] for row in rows]
+        self._ends = [row[1] for row in rows]
+        self._data = [row[2] for row in rows]
+
+    @classmethod
+    def from_csv(cls, path):
+        rows = []
+        with open(path, newline="") as file:
+            for record in csv.DictReader(file):
+                start = int(ipaddress.ip_address(record.pop("start_ip")))
+                end = int(ipaddress.ip_address(record.pop("end_ip")))
+                geo = parse_geo_point({key: value for key, value in record.items() if value})
+                rows.append((start, end, geo))
+        print(f"Loaded {len(rows)} IP ranges from {path}")
+        return cls(rows)
+
+    def lookup(self, ip_address):
+        try:
+            ip = int(ipaddress.ip_address(ip_address))
+        except ValueError:
+            return {}
+        position = bisect.bisect_right(self._starts, ip) - 1
+        if position >= 0 and ip <= self._ends[position]:
+            return dict(self._data[position])
+        return {}
+
+    def __len__(self):
+        return len(self._starts)
+
+
+ip2geo_cache = TTLCache(max_entries=IP2GEO_CACHE_SIZE, ttl=IP2GEO_CACHE_TTL)
+ip2geo_table = None
+_ip2geo_table_lock = threading.Lock()
+
+def get_ip2geo_table():
+    """
+    The IP range table of IP2GEO_DB_PATH, or None without one. With LEAN_STARTUP it is
+    loaded by the first lookup (on the analytics worker) rather than during init.
+    """
+    global ip2geo_table
+    if ip2geo_table is None and IP2GEO_DB_PATH:
+        with _ip2geo_table_lock:
+            if ip2geo_table is None:
+                ip2geo_table = IPRangeTable.from_csv(IP2GEO_DB_PATH)
+    return ip2geo_table
+
+if not LEAN_STARTUP:
+    get_ip2geo_table()
+
 def ip2geo_handler(os_client, ip_address):
-    
+    """
+    Geolocates an IP address, from the local range table when IP2GEO_DB_PATH is set,
+    otherwise through the ip-to-geo ingest pipeline. Results are cached per /24.
+    """
+    table = get_ip2geo_table()
+    if table is not None:
+        return table.lookup(ip_address)
+
+    cache_key = ip2geo_cache_key(ip_address)
+    cached = ip2geo_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    ip2geo_data = ip2geo_lookup_pipeline(os_client, ip_address)
+    ip2geo_cache.put(cache_key, ip2geo_data)
+    return dict(ip2geo_data)
+
+async def ip2geo_handler_async(async_client, ip_address):
+    """ip2geo_handler with an AsyncOpenSearch client."""
+    table = get_ip2geo_table()
+    if table is not None:
+        return table.lookup(ip_address)
+
+    cache_key = ip2geo_cache_key(ip_address)
+    cached = ip2geo_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    response = await async_client.transport.perform_request(
+        method="POST",
+        url=IP2GEO_SIMULATE_URL,
+        body=ip2geo_simulate_body(ip_address)
+    )
+    ip2geo_data = parse_ip2geo_response(response)
+    ip2geo_cache.put(cache_key, ip2geo_data)
+    return dict(ip2geo_data)
+
+def ip2geo_simulate_body(ip_address):
     ip2geo_payload = {
         "docs": [
             {
@@ -23,13 +153,17 @@ def ip2geo_handler(os_client, ip_address):
             }
         ]
     }
+    return json.dumps(ip2geo_payload)
 
+def ip2geo_lookup_pipeline(os_client, ip_address):
     response = os_client.transport.perform_request(
         method="POST",
-        url="/_ingest/pipeline/ip-to-geo-pipeline/_simulate",
-        body=json.dumps(ip2geo_payload)
+        url=IP2GEO_SIMULATE_URL,
+        body=ip2geo_simulate_body(ip_address)
     )
+    return parse_ip2geo_response(response)
 
+def parse_ip2geo_response(response):
     ip2geo_data = {}
 
     try:
@@ -41,57 +175,287 @@ def ip2geo_handler(os_client, ip_address):
     return ip2geo_data
 
 
-def create_opensearch_index(os_client, index_name):
-    """Create a new OpenSearch index if it doesn't exist."""
-    if not os_client.indices.exists(index=index_name):
-        # Define the mapping for the new index
-        index_body = {
-            "mappings": {
+# Mapping of the search log index
+SEARCH_LOG_INDEX_BODY = {
+    "mappings": {
+        "properties": {
+            "timestamp": {"type": "date"},
+            "lang": {"type": "keyword"},
+            "id": {"type": "keyword"},
+            "q": {"type": "keyword"},
+            "ip_address": {"type": "ip"},
+            "user_agent": {"type": "keyword"},
+            "http_method": {"type": "keyword"},
+            "sort_param": {"type": "keyword"},
+            "order_param": {"type": "keyword"},
+            "organization_filter": {"type": "keyword"},
+            "metadata_source_filter": {"type": "keyword"},
+            "theme_filter": {"type": "keyword"},
+            "type_filter": {"type": "keyword"},
+            "start_date_filter": {"type": "date", "null_value": "1970-01-01T00:00:00.000Z"},
+            "end_date_filter": {"type": "date", "null_value": "1970-01-01T00:00:00.000Z"},
+            "spatial_filter": {"type": "geo_shape"},
+            "relation": {"type": "keyword"},
+            "size": {"type": "keyword"},
+            "ip2geo": {
                 "properties": {
-                    "timestamp": {"type": "date"},
-                    "lang": {"type": "keyword"},
-                    "id": {"type": "keyword"},
-                    "q": {"type": "keyword"},
-                    "ip_address": {"type": "ip"},
-                    "user_agent": {"type": "keyword"},
-                    "http_method": {"type": "keyword"},
-                    "sort_param": {"type": "keyword"},
-                    "order_param": {"type": "keyword"},
-                    "organization_filter": {"type": "keyword"},
-                    "metadata_source_filter": {"type": "keyword"},
-                    "theme_filter": {"type": "keyword"},
-                    "type_filter": {"type": "keyword"},
-                    "start_date_filter": {"type": "date", "null_value": "1970-01-01T00:00:00.000Z"},
-                    "end_date_filter": {"type": "date", "null_value": "1970-01-01T00:00:00.000Z"},
-                    "spatial_filter": {"type": "geo_shape"},
-                    "relation": {"type": "keyword"},
-                    "size": {"type": "keyword"},
-                    "ip2geo": {
-                        "properties": {
-                            "continent_name": {"type": "keyword"},
-                            "region_iso_code": {"type": "keyword"},
-                            "city_name": {"type": "keyword"},
-                            "country_iso_code": {"type": "keyword"},
-                            "country_name": {"type": "keyword"},
-                            "region_name": {"type": "keyword"},
-                            "location": {"type": "geo_point"},
-                            "time_zone": {"type": "keyword"}
-                        }
-                    }
+                    "continent_name": {"type": "keyword"},
+                    "region_iso_code": {"type": "keyword"},
+                    "city_name": {"type": "keyword"},
+                    "country_iso_code": {"type": "keyword"},
+                    "country_name": {"type": "keyword"},
+                    "region_name": {"type": "keyword"},
+                    "location": {"type": "geo_point"},
+                    "time_zone": {"type": "keyword"}
                 }
             }
         }
+    }
+}
 
-        response = os_client.indices.create(index=index_name, body=index_body)
+def create_opensearch_index(os_client, index_name):
+    """Create a new OpenSearch index if it doesn't exist."""
+    if not os_client.indices.exists(index=index_name):
+        response = os_client.indices.create(index=index_name, body=SEARCH_LOG_INDEX_BODY)
         print(f"Created new OpenSearch index: {index_name}")
         return response
     else:
         print(f"Index '{index_name}' already exists.")
         return None
 
+async def create_opensearch_index_async(async_client, index_name):
+    """create_opensearch_index with an AsyncOpenSearch client."""
+    if not await async_client.indices.exists(index=index_name):
+        response = await async_client.indices.create(index=index_name, body=SEARCH_LOG_INDEX_BODY)
+        print(f"Created new OpenSearch index: {index_name}")
+        return response
+    print(f"Index '{index_name}' already exists.")
+    return None
+
 def save_to_opensearch(os_client, index, document):
     """
     Loads the transformed log data into OpenSearch.
     """
     for doc in document:
-        response = os_client.index(index=index, body=doc)
\ No newline at end of file
+        response = os_client.index(index=index, body=doc)
+
+def save_to_opensearch_bulk(os_client, index, documents):
+    """
+    Loads a batch of log documents into OpenSearch with a single bulk request.
+    """
+    if not documents:
+        return None
+    return report_bulk_errors(os_client.bulk(body=bulk_body(index, documents)))
+
+async def save_to_opensearch_bulk_async(async_client, index, documents):
+    """save_to_opensearch_bulk with an AsyncOpenSearch client."""
+    if not documents:
+        return None
+    return report_bulk_errors(await async_client.bulk(body=bulk_body(index, documents)))
+
+def bulk_body(index, documents):
+    lines = []
+    for doc in documents:
+        lines.append(json.dumps({"index": {"_index": index}}))
+        lines.append(json.dumps(doc))
+    return "\n".join(lines) + "\n"
+
+def report_bulk_errors(response):
+    if response.get("errors"):
+        failed = [item for item in response.get("items", []) if item.get("index", {}).get("error")]
+        print(f"Bulk indexing of search logs had {len(failed)} failures, first: {failed[:1]}")
+    return response
+
+
+# Queued by submit() to end an overdue batch
+_FLUSH = object()
+
+
+class AnalyticsLogger:
+    """
+    Buffers search log documents and writes them to OpenSearch from a background thread.
+
+    The request thread only enqueues; the index existence check, the ip2geo lookup
+    and a bulk write happen off the critical path. The queue is bounded and new
+    documents are dropped (and counted) when it is full.
+
+    With an async_client_factory (OS_TRANSPORT=async) a batch is written on the
+    shared event loop: the index check and the ip2geo lookups of the batch run
+    concurrently, then the bulk write.
+
+    On Lambda the writer is frozen with the container between invocations, so a
+    batch whose window ran out meanwhile is written by the next one: its submit()
+    closes the batch and the write overlaps with that invocation's search. The
+    documents of a container's last window are lost when Lambda reclaims it.
+    """
+
+    def __init__(self, client_factory, index_name, max_queue=ANALYTICS_QUEUE_SIZE,
+                 batch_size=ANALYTICS_BATCH_SIZE, flush_interval=ANALYTICS_FLUSH_INTERVAL,
+                 async_client_factory=None):
+        self.client_factory = client_factory
+        self.async_client_factory = async_client_factory
+        self.index_name = index_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self.last_write_ms = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        # Wall-clock start of the batch being collected, which (unlike the monotonic
+        # window of the queue waits) is sure to advance while a container is frozen
+        self._batch_started = None
+        self._flush_requested = False
+        self._index_ready = False
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, document, ip_address=None):
+        """Enqueue a log document without blocking. Returns False if it was dropped."""
+        self._ensure_worker()
+        self._close_overdue_batch()
+        try:
+            self._queue.put_nowait((document, ip_address))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"Analytics queue full, dropped search log (total dropped: {self.dropped})")
+            return False
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="analytics-logger", daemon=True)
+                self._worker.start()
+
+    def _close_overdue_batch(self):
+        """Ends the batch being collected now if its window has run out, e.g. while frozen."""
+        started = self._batch_started
+        if started is None or self._flush_requested or time.time() - started < self.flush_interval:
+            return
+        try:
+            self._queue.put_nowait(_FLUSH)
+            self._flush_requested = True
+        except queue.Full:
+            pass
+
+    def _get(self, timeout=None):
+        """The next queued document; _FLUSH markers are consumed and returned as such."""
+        item = self._queue.get(timeout=timeout) if timeout is None or timeout > 0 else self._queue.get_nowait()
+        if item is _FLUSH:
+            self._flush_requested = False
+            self._queue.task_done()
+        return item
+
+    def _next_batch(self):
+        item = self._get()
+        while item is _FLUSH:
+            item = self._get()
+        batch = [item]
+        self._batch_started = time.time()
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            # Past the window, still take what is already queued
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._get(timeout=max(remaining, 0))
+            except queue.Empty:
+                break
+            if item is _FLUSH:
+                break
+            batch.append(item)
+        self._batch_started = None
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            try:
+                self._write(batch)
+                self.last_write_ms = round((time.perf_counter() - start) * 1000, 1)
+            except Exception as e:
+                print(f"Error writing {len(batch)} search logs: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        if self.async_client_factory is not None:
+            from async_transport import run_coroutine
+            run_coroutine(self._write_async(batch))
+            return
+
+        os_client = self.client_factory()
+        if not self._index_ready:
+            create_opensearch_index(os_client, self.index_name)
+            self._index_ready = True
+
+        documents = []
+        for document, ip_address in batch:
+            if ip_address is not None:
+                try:
+                    document["ip2geo"] = ip2geo_handler(os_client, ip_address)
+                except Exception as e:
+                    print(f"Error resolving ip2geo for {ip_address}: {e}")
+                    document["ip2geo"] = {}
+            documents.append(document)
+
+        save_to_opensearch_bulk(os_client, self.index_name, documents)
+        self.written += len(documents)
+
+    async def _write_async(self, batch):
+        # Only the async transport writes this way, so asyncio is not imported at init
+        import asyncio
+
+        async_client = self.async_client_factory()
+
+        # One lookup per /24 in the batch, all in flight together with the index check
+        lookups = {}
+        for _, ip_address in batch:
+            if ip_address is not None and ip2geo_cache_key(ip_address) not in lookups:
+                lookups[ip2geo_cache_key(ip_address)] = ip2geo_handler_async(async_client, ip_address)
+        steps = [] if self._index_ready else [create_opensearch_index_async(async_client, self.index_name)]
+        results = await asyncio.gather(*steps, *lookups.values(), return_exceptions=True)
+
+        if steps:
+            if isinstance(results[0], Exception):
+                raise results[0]
+            self._index_ready = True
+        ip2geo_results = dict(zip(lookups, results[len(steps):]))
+
+        documents = []
+        for document, ip_address in batch:
+            if ip_address is not None:
+                ip2geo_data = ip2geo_results[ip2geo_cache_key(ip_address)]
+                if isinstance(ip2geo_data, Exception):
+                    print(f"Error resolving ip2geo for {ip_address}: {ip2geo_data}")
+                    ip2geo_data = {}
+                document["ip2geo"] = dict(ip2geo_data)
+            documents.append(document)
+
+        await save_to_opensearch_bulk_async(async_client, self.index_name, documents)
+        self.written += len(documents)
+
+    def ensure_index(self):
+        """
+        Creates the search log index if needed and starts the writer, so that
+        prewarming a container takes both off the first request.
+        """
+        if not self._index_ready:
+            create_opensearch_index(self.client_factory(), self.index_name)
+            self._index_ready = True
+        self._ensure_worker()
+
+    def flush(self, timeout=None):
+        """Wait until every queued document has been written, or the timeout expires."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped, "last_write_ms": self.last_write_ms}
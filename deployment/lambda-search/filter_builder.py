@@ -1,5 +1,12 @@
+from os import environ
 from datetime import datetime
 
+# Print every generated clause, off by default to keep request logs small
+DEBUG_QUERIES = environ.get('DEBUG_QUERIES', 'false').lower() == 'true'
+# Match facets with the 'filter_modes' of filter_config.json. Their fields only exist once the
+# index is rebuilt with Create_Opensearch_index.py, so turn this on after the reindex
+FILTER_MODES_ENABLED = environ.get('FILTER_MODES_ENABLED', 'false').lower() == 'true'
+
 def build_wildcard_filter(field_paths, values):
     """
     Builds a wildcard OR filter for multiple field paths and values.
@@ -26,7 +33,36 @@ def build_wildcard_filter(field_paths, values):
         for field_path in field_paths
     ]
 
-    print(should_clauses)
+    if DEBUG_QUERIES:
+        print(should_clauses)
+
+    return {
+        "bool": {
+            "should": should_clauses,
+            "minimum_should_match": 1
+        }
+    }
+
+def _split_values(values):
+    return [val.strip() for val in values.split(",") if val.strip()]
+
+def build_terms_filter(field_paths, values):
+    """
+    Builds an exact-match OR filter on normalized (lowercased) keyword fields.
+
+    Args:
+        field_paths (list): Normalized keyword field paths from configuration.
+        values (str): A comma-separated string of values to filter.
+
+    Returns:
+        dict: A bool query with one terms clause per field path.
+    """
+    value_list = sorted({val.lower() for val in _split_values(values)})
+
+    should_clauses = [
+        {"terms": {field_path: value_list}}
+        for field_path in field_paths
+    ]
 
     return {
         "bool": {
@@ -35,6 +71,90 @@ def build_wildcard_filter(field_paths, values):
         }
     }
 
+def build_prefix_filter(field_paths, values):
+    """
+    Builds a prefix OR filter on normalized (lowercased) keyword fields.
+
+    Args:
+        field_paths (list): Normalized keyword field paths from configuration.
+        values (str): A comma-separated string of value prefixes to filter.
+
+    Returns:
+        dict: A bool query with should clauses for logical OR.
+    """
+    should_clauses = [
+        {"prefix": {field_path: {"value": value.lower()}}}
+        for value in _split_values(values)
+        for field_path in field_paths
+    ]
+
+    return {
+        "bool": {
+            "should": should_clauses,
+            "minimum_should_match": 1
+        }
+    }
+
+def build_edge_ngram_filter(field_paths, values):
+    """
+    Builds a partial-word OR filter on edge n-gram subfields. Every word of a value
+    must start a word of the field, e.g. 'climate' matches 'Environment and Climate Change Canada'.
+
+    Args:
+        field_paths (list): Edge n-gram text field paths from configuration.
+        values (str): A comma-separated string of values to filter.
+
+    Returns:
+        dict: A bool query with should clauses for logical OR.
+    """
+    should_clauses = [
+        {"match": {field_path: {"query": value, "operator": "and"}}}
+        for value in _split_values(values)
+        for field_path in field_paths
+    ]
+
+    return {
+        "bool": {
+            "should": should_clauses,
+            "minimum_should_match": 1
+        }
+    }
+
+KEYWORD_FILTER_BUILDERS = {
+    "terms": build_terms_filter,
+    "prefix": build_prefix_filter,
+    "edge_ngram": build_edge_ngram_filter,
+    "wildcard": build_wildcard_filter
+}
+
+def build_keyword_filter(filter_name, values, filter_config):
+    """
+    Builds the filter for one request parameter using the mode configured for it.
+
+    Args:
+        filter_name (str): The request parameter, e.g. 'org' or 'theme'.
+        values (str): A comma-separated string of values to filter.
+        filter_config (dict): The loaded filter_config.json.
+
+    Returns:
+        dict: The filter query. Parameters without an entry in 'filter_modes', or
+              every parameter while FILTER_MODES_ENABLED is off, use a wildcard
+              filter on their configured field paths.
+
+    Raises:
+        ValueError: If the configured mode is unsupported.
+    """
+    mode_config = filter_config.get("filter_modes", {}).get(filter_name) if FILTER_MODES_ENABLED else None
+    if not mode_config:
+        return build_wildcard_filter(filter_config[filter_name], values)
+
+    mode = mode_config.get("mode", "wildcard")
+    if mode not in KEYWORD_FILTER_BUILDERS:
+        raise ValueError(f"Unsupported filter mode '{mode}' for '{filter_name}'. Must be one of {list(KEYWORD_FILTER_BUILDERS)}.")
+
+    field_paths = mode_config.get("fields") or filter_config[filter_name]
+    return KEYWORD_FILTER_BUILDERS[mode](field_paths, values)
+
 def build_date_filter(begin_field=None, end_field=None, start_date=None, end_date=None):
     """
     Builds a string-based range filter for date fields supporting partial dates, 'null', 'not available; indisponible', and 'current'.
@@ -223,7 +343,8 @@ def build_sort_filter(lang_filter, sort_field="relevancy", sort_order="desc"):
 
     # Adjust for specific OpenSearch requirements
     field_mapping = {}
-    print("lang_filter", lang_filter)
+    if DEBUG_QUERIES:
+        print("lang_filter", lang_filter)
     if lang_filter == "en":
         field_mapping = {
             "title": "title_en.keyword",  # Sort 'title' by its keyword version
@@ -242,7 +363,8 @@ def build_sort_filter(lang_filter, sort_field="relevancy", sort_order="desc"):
         raise ValueError("Invalid sort order. Must be 'asc' or 'desc'.")
 
     # Return the sort parameter
-    print(sort_field, " ", sort_order)
+    if DEBUG_QUERIES:
+        print(sort_field, " ", sort_order)
     return [{sort_field: {"order": sort_order}}]
 
 def build_sort_filter2(sort_field="relevancy", sort_order="desc"):
@@ -0,0 +1,197 @@
+from os import environ
+
+# 'hybrid' scores everything in one bool.should query, 'fusion' runs the lexical and vector
+# legs separately in one _msearch and fuses their rankings in the Lambda
+SEARCH_MODE = environ.get('SEARCH_MODE', 'hybrid')
+FUSION_METHOD = environ.get('FUSION_METHOD', 'rrf')
+FUSION_LEXICAL_WEIGHT = float(environ.get('FUSION_LEXICAL_WEIGHT', '1.0'))
+FUSION_VECTOR_WEIGHT = float(environ.get('FUSION_VECTOR_WEIGHT', '1.0'))
+FUSION_RRF_RANK_CONSTANT = int(environ.get('FUSION_RRF_RANK_CONSTANT', '60'))
+FUSION_LEG_K = int(environ.get('FUSION_LEG_K', '20'))  # Candidates per leg, raised to cover the requested page
+FUSION_VECTOR_MIN_SCORE = float(environ.get('FUSION_VECTOR_MIN_SCORE', '0.55'))
+FUSION_METHODS = ["rrf", "minmax"]
+# Minimum score of the single-query hybrid search
+HYBRID_MIN_SCORE = 0.55
+
+# Fields and boosts of the lexical (BM25) part of the search
+LEXICAL_FIELDS = ["*topicCategory*", "*keywords*^5", "*description*^15", "*title*^10", "*organisation*", "*systemName*", "*id*^5"]
+
+
+def build_lexical_clause(search_text, boost=None):
+    """BM25 multi_match over LEXICAL_FIELDS."""
+    clause = {
+        "query": search_text,
+        "fields": LEXICAL_FIELDS,
+        "type": "best_fields"
+    }
+    if boost is not None:
+        clause["boost"] = boost
+    return {"multi_match": clause}
+
+def build_hybrid_query(search_text, knn_clause, filters=None):
+    """The filtered bool query of the hybrid search, to be used with HYBRID_MIN_SCORE."""
+    return {
+        "bool": {
+            "should": build_hybrid_clauses(search_text, knn_clause),
+            "minimum_should_match": 1,
+            "filter": filters if filters else []
+        }
+    }
+
+def build_hybrid_clauses(search_text, knn_clause):
+    """
+    The bool.should clauses of the single-query hybrid search: a down-weighted BM25
+    match, a boost for mappable records and the vector clause. Used with a min_score.
+    """
+    return [
+        build_lexical_clause(search_text, boost=0.007),
+        {
+            "term": {
+                "mappable": {
+                    "value": True,
+                    "boost": 0.15   # adjust boost as needed
+                }
+            }
+        },
+        knn_clause
+    ]
+
+def leg_k(from_param, size, min_k=FUSION_LEG_K):
+    """Candidates fetched by each leg: enough to fill the requested page after fusion."""
+    return max(min_k, from_param + size)
+
+def build_fusion_searches(idx_name, search_text, knn_clause, filters, k, source_filter, aggs=None, vector_rescore=None, totals_query=None):
+    """
+    Builds the _msearch body for the lexical and vector legs. Both legs apply the
+    filters and return k hits; the optional exact rescore stage (see
+    query_compiler.build_rescore) goes on the vector leg. The legs only rank a few
+    candidates, so the total and the facet aggregations come from a third, size 0
+    search of totals_query (the hybrid query, see build_hybrid_query) when given,
+    and from the vector leg otherwise.
+    """
+    lexical = {
+        "size": k,
+        "_source": source_filter,
+        "query": {
+            "bool": {
+                "must": [build_lexical_clause(search_text)],
+                "filter": filters if filters else []
+            }
+        }
+    }
+    vector = {
+        "size": k,
+        "_source": source_filter,
+        "query": {
+            "bool": {
+                "must": [knn_clause],
+                "filter": filters if filters else []
+            }
+        }
+    }
+    if FUSION_VECTOR_MIN_SCORE > 0:
+        vector["min_score"] = FUSION_VECTOR_MIN_SCORE
+    if aggs and totals_query is None:
+        vector["aggs"] = aggs
+    if vector_rescore:
+        vector["rescore"] = vector_rescore
+    searches = [{"index": idx_name}, lexical, {"index": idx_name}, vector]
+    if totals_query is not None:
+        totals = {"size": 0, "query": totals_query, "min_score": HYBRID_MIN_SCORE}
+        if aggs:
+            totals["aggs"] = aggs
+        searches += [{"index": idx_name}, totals]
+    return searches
+
+def leg_hits(leg_response, leg_name):
+    """Hits of one _msearch response, or no hits (logged) when the leg failed."""
+    if "error" in leg_response:
+        print(f"Fusion {leg_name} leg failed: {leg_response['error']}")
+        return []
+    return leg_response["hits"]["hits"]
+
+def reciprocal_rank_fusion(rankings, weights, rank_constant=FUSION_RRF_RANK_CONSTANT):
+    """
+    Fuses ranked hit lists with weighted reciprocal-rank fusion:
+    score(d) = sum over rankings of weight / (rank_constant + rank of d), ranks from 1.
+
+    Returns:
+        list: (score, hit) tuples by descending fused score.
+    """
+    fused = {}
+    for hits, weight in zip(rankings, weights):
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["_id"], [0.0, hit, rank])
+            entry[0] += weight / (rank_constant + rank)
+            entry[2] = min(entry[2], rank)
+    return _ranked(fused)
+
+def min_max_fusion(rankings, weights):
+    """
+    Fuses ranked hit lists by blending min-max normalized scores:
+    score(d) = sum over rankings of weight * (score - min) / (max - min).
+    A document missing from a ranking gets 0 from it; a ranking whose scores are
+    all equal counts 1 for each of its documents.
+
+    Returns:
+        list: (score, hit) tuples by descending fused score.
+    """
+    fused = {}
+    for hits, weight in zip(rankings, weights):
+        if not hits:
+            continue
+        scores = [hit["_score"] or 0.0 for hit in hits]
+        low, high = min(scores), max(scores)
+        for rank, (hit, score) in enumerate(zip(hits, scores), start=1):
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            entry = fused.setdefault(hit["_id"], [0.0, hit, rank])
+            entry[0] += weight * normalized
+            entry[2] = min(entry[2], rank)
+    return _ranked(fused)
+
+def _ranked(fused):
+    # Ties go to the document ranked higher in either list, then to the lower _id
+    ordered = sorted(fused.items(), key=lambda item: (-item[1][0], item[1][2], item[0]))
+    return [(score, hit) for _, (score, hit, _) in ordered]
+
+def fuse(rankings, method=FUSION_METHOD, weights=None):
+    """
+    Fuses ranked hit lists with the given method.
+
+    Raises:
+        ValueError: If the fusion method is unsupported.
+    """
+    if weights is None:
+        weights = [1.0] * len(rankings)
+    if method == "rrf":
+        return reciprocal_rank_fusion(rankings, weights)
+    if method == "minmax":
+        return min_max_fusion(rankings, weights)
+    raise ValueError(f"Unsupported fusion method '{method}'. Must be one of {FUSION_METHODS}.")
+
+def fused_search_results(msearch_response, from_param, size, method=FUSION_METHOD,
+                         weights=(FUSION_LEXICAL_WEIGHT, FUSION_VECTOR_WEIGHT)):
+    """
+    Turns the _msearch response of build_fusion_searches into a search response for
+    the requested page, so it can be passed to create_api_response_geojson.
+    Each hit's _score is its fused score. The total and the aggregations are those of
+    the totals search when there is one, so they match the hybrid search; otherwise
+    (or when it failed) the total is the number of distinct documents of the two legs.
+    """
+    lexical_response, vector_response = msearch_response["responses"][:2]
+    rankings = [leg_hits(lexical_response, "lexical"), leg_hits(vector_response, "vector")]
+    fused = fuse(rankings, method, list(weights))
+
+    responses = msearch_response["responses"]
+    totals_response = responses[2] if len(responses) > 2 else vector_response
+    if "error" in totals_response:
+        print(f"Fusion totals search failed: {totals_response['error']}")
+        totals_response = {}
+    total = totals_response.get("hits", {}).get("total") if totals_response is not vector_response else None
+
+    page = [dict(hit, _score=round(score, 6)) for score, hit in fused[from_param:from_param + size]]
+    return {
+        "took": max(response.get("took", 0) for response in responses),
+        "hits": {"total": total or {"value": len(fused), "relation": "eq"}, "hits": page},
+        "aggregations": totals_response.get("aggregations", {})
+    }
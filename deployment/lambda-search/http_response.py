@@ -0,0 +1,178 @@
+import gzip
+import base64
+import hashlib
+
+from os import environ
+
+from response_builder import json_dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 'legacy' returns the original non-proxy payloads, 'proxy' returns statusCode/headers/body
+# responses so the Lambda can set ETag, Cache-Control and Content-Encoding itself
+HTTP_RESPONSE_MODE = environ.get('HTTP_RESPONSE_MODE', 'legacy')
+COMPRESSION_MIN_BYTES = int(environ.get('COMPRESSION_MIN_BYTES', '1024'))
+CACHE_CONTROL_MAX_AGE = int(environ.get('CACHE_CONTROL_MAX_AGE', '60'))
+BROWSE_CACHE_MAX_AGE = int(environ.get('BROWSE_CACHE_MAX_AGE', '300'))
+
+# Settings whose values shape a response body, by environment variable name prefix
+RESPONSE_SETTING_PREFIXES = (
+    "SEARCH_MODE", "HYBRID_", "FUSION_", "KNN_", "EXACT_KNN_", "FILTER_", "MODEL_NAME",
+    "SAGEMAKER_ENDPOINT", "ENCODER_MODE", "LOCAL_ENCODER_", "SHARED_EMBEDDING_DTYPE", "JSON_BACKEND"
+)
+
+CORS_HEADERS = {
+    "access-control-allow-origin": "*",
+    "access-control-expose-headers": "ETag"
+}
+
+
+class RequestError(Exception):
+    """
+    A client error in the legacy response mode. Its message starts with the status
+    code, e.g. '[400] ...', for the integration response selection patterns of the
+    non-proxy API Gateway integration (see the README).
+    """
+
+    def __init__(self, status_code, message):
+        super().__init__(f"[{status_code}] {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+def request_header(event, name):
+    """
+    Reads a request header from a proxy event ('headers') or from the snake_case key
+    the API Gateway mapping template uses (e.g. If-None-Match -> if_none_match).
+    """
+    headers = event.get('headers') or {}
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return event.get(lowered.replace('-', '_'))
+
+def response_fingerprint(paths, environment=environ, prefixes=RESPONSE_SETTING_PREFIXES):
+    """
+    Digest of what besides the index and the request shapes a response body: the
+    published function version, the response settings and the contents of the given
+    files (the code and filter_config.json). Missing files are skipped.
+    """
+    digest = hashlib.sha256(environment.get('AWS_LAMBDA_FUNCTION_VERSION', '').encode('utf-8'))
+    for name in sorted(environment):
+        if name.startswith(prefixes):
+            digest.update(f"\x1f{name}={environment[name]}".encode('utf-8'))
+    for path in sorted(paths):
+        try:
+            with open(path, "rb") as file:
+                digest.update(b"\x1f" + file.read())
+        except OSError:
+            continue
+    return digest.hexdigest()[:16]
+
+def compute_etag(index_version, request_key, fingerprint=""):
+    """
+    Weak ETag for a request against an index version and deployment fingerprint (see
+    response_fingerprint), or None if the version is unknown. The version token changes
+    with the indexed documents (see cache.IndexVersionTracker). It is weak because the
+    same tag is sent for the gzip, br and identity codings of a body.
+    """
+    if not index_version:
+        return None
+    digest = hashlib.sha256(f"{fingerprint}\x1f{index_version}\x1f{request_key}".encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+def etag_matches(if_none_match, etag):
+    """True when an If-None-Match header value matches the ETag (weak comparison)."""
+    if not if_none_match or not etag:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    if '*' in candidates:
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return any((value[2:] if value.startswith('W/') else value) == opaque for value in candidates)
+
+def cache_control(canonical, cacheable):
+    """
+    Cache-Control for a search response. Anonymous browse listings (empty query) can
+    be cached longer by a CDN; cursor pages and uncacheable responses are not cached.
+    """
+    if not cacheable:
+        return "no-store"
+    max_age = BROWSE_CACHE_MAX_AGE if not canonical.get('q') else CACHE_CONTROL_MAX_AGE
+    return f"public, max-age={max_age}, s-maxage={max_age}"
+
+def negotiate_encoding(accept_encoding):
+    """Picks br (when brotli is installed) or gzip from an Accept-Encoding header, else None."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def build_http_response(response, event, etag=None, cache_control_value="no-store", extra_headers=None, body=None):
+    """
+    Wraps a legacy handler response (either {"statusCode", "body"} or a payload dict)
+    into a proxy response with caching headers and negotiated compression. A payload
+    the caller has already serialized is passed as body.
+    """
+    status_code = response.get("statusCode", 200) if "body" in response else 200
+    if body is None:
+        body = response["body"] if "body" in response else json_dumps(response)
+
+    headers = dict(CORS_HEADERS)
+    headers["Content-Type"] = "application/json"
+    headers["Cache-Control"] = cache_control_value
+    headers["Vary"] = "Accept-Encoding"
+    if etag:
+        headers["ETag"] = etag
+    if extra_headers:
+        headers.update(extra_headers)
+
+    encoded = body.encode("utf-8")
+    encoding = negotiate_encoding(request_header(event, "Accept-Encoding"))
+    if encoding and len(encoded) >= COMPRESSION_MIN_BYTES:
+        headers["Content-Encoding"] = encoding
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": base64.b64encode(compress(encoded, encoding)).decode("ascii"),
+            "isBase64Encoded": True
+        }
+
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": body,
+        "isBase64Encoded": False
+    }
+
+def not_modified_response(etag, cache_control_value, extra_headers=None):
+    """304 response for a matching If-None-Match, sent without running the search."""
+    headers = dict(CORS_HEADERS)
+    headers["ETag"] = etag
+    headers["Cache-Control"] = cache_control_value
+    headers["Vary"] = "Accept-Encoding"
+    if extra_headers:
+        headers.update(extra_headers)
+    return {"statusCode": 304, "headers": headers, "body": "", "isBase64Encoded": False}
@@ -0,0 +1,79 @@
+import os
+import threading
+
+from os import environ
+
+# 'sagemaker' calls the endpoint, 'local' embeds queries in-process with the exported ONNX model
+ENCODER_MODE = environ.get('ENCODER_MODE', 'sagemaker')
+LOCAL_ENCODER_DIR = environ.get('LOCAL_ENCODER_DIR', 'encoder')
+LOCAL_ENCODER_MAX_LENGTH = int(environ.get('LOCAL_ENCODER_MAX_LENGTH', '256'))
+LOCAL_ENCODER_THREADS = int(environ.get('LOCAL_ENCODER_THREADS', '1'))
+LOCAL_ENCODER_NORMALIZE = environ.get('LOCAL_ENCODER_NORMALIZE', 'false').lower() == 'true'
+
+
+class LocalQueryEncoder:
+    """
+    In-process sentence encoder for short search queries.
+
+    Loads an int8-quantized ONNX export of the deployed model (see
+    src/export_onnx_encoder.py) and its fast tokenizer, and reproduces the
+    endpoint's output: mean pooling over the attention mask, with truncation at
+    LOCAL_ENCODER_MAX_LENGTH tokens like deployment/pytorch/code/inference.py.
+    """
+
+    def __init__(self, model_dir=LOCAL_ENCODER_DIR, max_length=LOCAL_ENCODER_MAX_LENGTH,
+                 threads=LOCAL_ENCODER_THREADS, normalize=LOCAL_ENCODER_NORMALIZE):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self._np = np
+        self.normalize = normalize
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.int8.onnx"), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, text):
+        """Returns the embedding of one query as a list of floats."""
+        np = self._np
+        encoding = self.tokenizer.encode(str(text))
+        input_ids = np.asarray([encoding.ids], dtype=np.int64)
+        attention_mask = np.asarray([encoding.attention_mask], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling - take the attention mask into account for correct averaging
+        mask = attention_mask[..., None].astype(np.float32)
+        embedding = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        embedding = embedding[0]
+        if self.normalize:
+            embedding = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+        return embedding.astype(np.float32).tolist()
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+def get_local_encoder():
+    """Loads the local encoder once per container."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = LocalQueryEncoder()
+                print(f"Loaded local query encoder from {LOCAL_ENCODER_DIR}")
+    return _encoder
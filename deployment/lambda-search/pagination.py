@@ -0,0 +1,154 @@
+import json
+import time
+import base64
+import binascii
+import threading
+
+from os import environ
+
+PIT_KEEP_ALIVE = environ.get('PIT_KEEP_ALIVE', '5m')
+# Unique per document, appended to the sort so search_after never skips or repeats ties
+CURSOR_TIEBREAKER_FIELD = environ.get('CURSOR_TIEBREAKER_FIELD', 'id.keyword')
+# Point-in-times a container may hold open at once, well under the cluster's
+# point_in_time.max_open_pit_context (300 by default) shared by every container
+PIT_MAX_OPEN = int(environ.get('PIT_MAX_OPEN', '50'))
+
+_KEEP_ALIVE_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded or belongs to a different request."""
+
+
+class CursorLimitExceeded(Exception):
+    """Raised when a new cursor would open more than PIT_MAX_OPEN point-in-times."""
+
+
+def keep_alive_seconds(keep_alive):
+    """Seconds of an OpenSearch time value such as '5m' or '30s'."""
+    for unit in sorted(_KEEP_ALIVE_UNITS, key=len, reverse=True):
+        if keep_alive.endswith(unit) and keep_alive[:-len(unit)].isdigit():
+            return int(keep_alive[:-len(unit)]) * _KEEP_ALIVE_UNITS[unit]
+    raise ValueError(f"Unsupported keep_alive '{keep_alive}'")
+
+
+class OpenPointInTimes:
+    """
+    The point-in-times this container opened that are neither closed nor expired.
+    Each one counts until its keep_alive runs out after its last page.
+    """
+
+    def __init__(self, max_open=PIT_MAX_OPEN, keep_alive=PIT_KEEP_ALIVE, clock=time.monotonic):
+        self.max_open = max_open
+        self.ttl = keep_alive_seconds(keep_alive)
+        self._clock = clock
+        self._expiry = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for pit_id in [pit_id for pit_id, expiry in self._expiry.items() if expiry <= now]:
+            del self._expiry[pit_id]
+
+    def reserve(self):
+        """Counts a point-in-time about to be opened, or raises CursorLimitExceeded."""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            if len(self._expiry) >= self.max_open:
+                raise CursorLimitExceeded(f"Too many open cursors ({self.max_open}), retry later or page with from/size")
+            token = object()
+            self._expiry[token] = now + self.ttl
+            return token
+
+    def opened(self, token, pit_id):
+        with self._lock:
+            self._expiry[pit_id] = self._expiry.pop(token, self._clock() + self.ttl)
+
+    def touch(self, pit_id):
+        """Extends the count of a point-in-time whose keep_alive was renewed by a page."""
+        with self._lock:
+            if pit_id in self._expiry:
+                self._expiry[pit_id] = self._clock() + self.ttl
+
+    def release(self, key):
+        with self._lock:
+            self._expiry.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._expiry)
+
+
+open_pits = OpenPointInTimes()
+
+
+def encode_cursor(state):
+    """Serializes cursor state into an opaque URL-safe token."""
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(token, fingerprint):
+    """
+    Decodes a token from encode_cursor and checks it was issued for the same
+    request (same query, filters, sort and page size).
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+    if not isinstance(state, dict) or not {"pit", "after", "depth", "fp"} <= set(state):
+        raise InvalidCursor("Invalid cursor: missing fields")
+    if state["fp"] != fingerprint:
+        raise InvalidCursor("Cursor does not belong to this request")
+    return state
+
+def start_cursor(os_client, index, fingerprint, keep_alive=PIT_KEEP_ALIVE):
+    """
+    Opens a point-in-time on the index and returns the state of the first page.
+    Raises CursorLimitExceeded when the container already holds PIT_MAX_OPEN of them.
+    """
+    token = open_pits.reserve()
+    try:
+        response = os_client.create_point_in_time(index=index, keep_alive=keep_alive)
+    except Exception:
+        open_pits.release(token)
+        raise
+    open_pits.opened(token, response["pit_id"])
+    return {"pit": response["pit_id"], "after": None, "depth": 0, "fp": fingerprint}
+
+def close_cursor(os_client, pit_id):
+    """Deletes a point-in-time after its last page instead of waiting for keep_alive."""
+    open_pits.release(pit_id)
+    try:
+        os_client.delete_point_in_time(body={"pit_id": [pit_id]})
+    except Exception as e:
+        print(f"Error deleting point-in-time: {e}")
+
+def apply_cursor(query, state, keep_alive=PIT_KEEP_ALIVE):
+    """
+    Turns a from/size query into a point-in-time search_after query for the cursor state.
+    Facet aggregations are only computed for the first page.
+    """
+    query.pop("from", None)
+    open_pits.touch(state["pit"])
+    query["pit"] = {"id": state["pit"], "keep_alive": keep_alive}
+    query["sort"] = list(query.get("sort") or [{"_score": {"order": "desc"}}]) + [{CURSOR_TIEBREAKER_FIELD: {"order": "asc"}}]
+    if state["after"] is not None:
+        query["search_after"] = state["after"]
+    if state["depth"] > 0:
+        query.pop("aggs", None)
+    return query
+
+def next_cursor(state, search_results, size):
+    """Returns the cursor for the page after search_results, or None on the last page."""
+    hits = search_results["hits"]["hits"]
+    if len(hits) < size or not hits:
+        return None
+    return encode_cursor({
+        "pit": search_results.get("pit_id", state["pit"]),
+        "after": hits[-1]["sort"],
+        "depth": state["depth"] + len(hits),
+        "fp": state["fp"]
+    })
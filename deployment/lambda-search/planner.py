@@ -0,0 +1,42 @@
+from os import environ
+from cache import TTLCache
+
+# Filtered requests with at most this many candidate documents are scored exactly; 0 disables
+EXACT_KNN_MAX_CANDIDATES = int(environ.get('EXACT_KNN_MAX_CANDIDATES', '1000'))
+CANDIDATE_COUNT_CACHE_SIZE = int(environ.get('CANDIDATE_COUNT_CACHE_SIZE', '1024'))
+CANDIDATE_COUNT_CACHE_TTL = int(environ.get('CANDIDATE_COUNT_CACHE_TTL', '300'))
+
+candidate_counts = TTLCache(max_entries=CANDIDATE_COUNT_CACHE_SIZE, ttl=CANDIDATE_COUNT_CACHE_TTL)
+
+
+def estimate_candidates(os_client, index, filters, cache_key):
+    """
+    Returns the number of documents matching the filters, from the count cache or a
+    _count request. None means unknown (no filters, planner disabled or count failed).
+    """
+    if not filters or EXACT_KNN_MAX_CANDIDATES <= 0:
+        return None
+
+    count = candidate_counts.get(cache_key)
+    if count is None:
+        try:
+            response = os_client.count(index=index, body={"query": {"bool": {"filter": filters}}})
+            count = response["count"]
+        except Exception as e:
+            print(f"Error estimating candidate count: {e}")
+            return None
+        candidate_counts.put(cache_key, count)
+    return count
+
+def plan_knn(estimated_candidates, max_candidates=EXACT_KNN_MAX_CANDIDATES, timer=None):
+    """
+    Picks 'exact' brute-force scoring for small filtered candidate sets and 'ann'
+    (HNSW) otherwise. The decision goes into the request's timing line.
+    """
+    strategy = "ann"
+    if estimated_candidates is not None and estimated_candidates <= max_candidates:
+        strategy = "exact"
+    if timer:
+        timer.set("knn_plan", strategy)
+        timer.set("estimated_candidates", estimated_candidates)
+    return strategy
@@ -0,0 +1,240 @@
+import json
+import math
+
+from os import environ
+from datetime import date
+from functools import lru_cache
+
+from cache import LIST_FILTER_PARAMS
+from filter_builder import build_keyword_filter, build_date_filter, build_spatial_filter, build_sort_filter
+
+QUERY_CACHE_SIZE = int(environ.get('QUERY_CACHE_SIZE', '512'))
+FILTER_CONFIG_PATH = environ.get('FILTER_CONFIG_PATH', 'filter_config.json')
+
+# kNN settings: 'post' applies filters after the approximate search (bool.filter only),
+# 'efficient' also passes them inside the knn clause so they are applied during graph traversal
+KNN_FILTER_MODE = environ.get('KNN_FILTER_MODE', 'post')
+KNN_MIN_K = int(environ.get('KNN_MIN_K', '10'))
+KNN_MAX_K = int(environ.get('KNN_MAX_K', '10000'))
+KNN_EF_SEARCH_FACTOR = float(environ.get('KNN_EF_SEARCH_FACTOR', '0'))  # 0 keeps the index default
+KNN_FILTER_MODES = ["post", "efficient"]
+# Two-stage retrieval for indexes whose HNSW graph holds compressed (fp16/int8) vectors:
+# fetch k * KNN_OVERSAMPLE_FACTOR approximate neighbours, then, with KNN_RESCORE, rescore
+# that window exactly against the full-precision vectors
+KNN_OVERSAMPLE_FACTOR = float(environ.get('KNN_OVERSAMPLE_FACTOR', '1.0'))
+KNN_RESCORE = environ.get('KNN_RESCORE', 'false').lower() == 'true'
+# Engine of the index's vector field, which sets the scale of its cosinesimil scores: 1 / (2 - cosine)
+# for nmslib and faiss, (1 + cosine) / 2 for lucene (the int8 option of Create_Opensearch_index.py)
+KNN_ENGINE = environ.get('KNN_ENGINE', 'nmslib')
+KNN_COSINE_SCORE_SCRIPTS = {
+    "nmslib": "1.0 / (2.0 - cosineSimilarity(params.query_value, doc[params.field]))",
+    "faiss": "1.0 / (2.0 - cosineSimilarity(params.query_value, doc[params.field]))",
+    "lucene": "(1.0 + cosineSimilarity(params.query_value, doc[params.field])) / 2.0"
+}
+
+# Request parameters filtered on, in the order their clauses are emitted
+KEYWORD_FILTER_PARAMS = [
+    "org", "source_system", "theme", "topic_category", "type", "protocol", "mappable",
+    "eo_collection", "polarization", "orbit_direction"
+]
+
+# Facet aggregations returned with every semantic search, by name and filter_config key
+AGGREGATIONS = [
+    ("unique_mappable", "mappable"),
+    ("unique_protocol", "protocol"),
+    ("unique_org", None),
+    ("unique_source_system", "source_system"),
+    ("unique_eo_collection", "eo_collection"),
+    ("unique_topic_category", "topic_category"),
+    ("unique_theme", "theme")
+]
+
+
+@lru_cache(maxsize=None)
+def get_filter_config(file_path=FILTER_CONFIG_PATH):
+    """
+    Loads filter_config.json once per container. The returned dict is shared, do not modify it.
+    """
+    with open(file_path, "r") as file:
+        return json.load(file)
+
+def filter_ast(canonical):
+    """
+    Extracts the filter part of a canonical request (see cache.canonical_request)
+    as a hashable tuple of (parameter, value) nodes in a fixed order.
+    """
+    nodes = []
+    for param in LIST_FILTER_PARAMS:
+        if param in canonical:
+            nodes.append((param, tuple(canonical[param])))
+    for param in ("begin", "end"):
+        if param in canonical:
+            nodes.append((param, canonical[param]))
+    if "bbox" in canonical:
+        bbox = canonical["bbox"]
+        nodes.append(("bbox", tuple(bbox) if isinstance(bbox, list) else bbox))
+        nodes.append(("relation", canonical["relation"]))
+    return tuple(nodes)
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _compile_filters(ast, today):
+    filter_config = get_filter_config()
+    nodes = dict(ast)
+    filters = []
+
+    """ Keyword filters """
+    for param in KEYWORD_FILTER_PARAMS:
+        if param in nodes:
+            filters.append(build_keyword_filter(param, ",".join(nodes[param]), filter_config))
+
+    """ Temporal filters """
+    start_date, end_date = nodes.get("begin"), nodes.get("end")
+    if start_date and end_date:
+        filters.extend(build_date_filter(filter_config["begin"][0], filter_config["end"][0], start_date=start_date, end_date=end_date))
+    elif start_date:
+        filters.extend(build_date_filter(filter_config["begin"][0], start_date=start_date))
+    elif end_date:
+        filters.extend(build_date_filter(end_field=filter_config["end"][0], end_date=end_date))
+
+    """ Spatial filters """
+    if "bbox" in nodes:
+        bbox = nodes["bbox"]
+        bbox = ",".join(str(value) for value in bbox) if isinstance(bbox, tuple) else bbox
+        filters.append(build_spatial_filter(filter_config["bbox"][0], bbox, nodes["relation"]))
+
+    return tuple(filters)
+
+def compile_filters(ast):
+    """
+    Returns the filter clauses for a filter AST, or None when there are none.
+    Compiled fragments are memoized per AST (and per day, for 'present' end dates)
+    and shared between requests, so callers must not modify them.
+    """
+    filters = _compile_filters(ast, date.today().isoformat())
+    return list(filters) if filters else None
+
+@lru_cache(maxsize=None)
+def compile_aggregations(lang):
+    """
+    Static facet aggregation block for a language, built once per container.
+    Facets whose field is missing from filter_config.json are left out.
+    """
+    filter_config = get_filter_config()
+    aggs = {}
+    for name, config_key in AGGREGATIONS:
+        if config_key is None:
+            field = "organisation.en.keyword" if lang == "en" else "organisation.fr.keyword"
+        elif config_key not in filter_config:
+            print(f"No '{config_key}' field in the filter config, skipping the {name} aggregation")
+            continue
+        else:
+            field = filter_config[config_key][0]
+        aggs[name] = {"terms": {"field": field, "size": 100}}
+    return aggs
+
+@lru_cache(maxsize=None)
+def compile_source_filter():
+    """
+    _source projection from 'response_fields' in filter_config.json, built once per container.
+    An empty includes list returns every field not excluded. The vector and the
+    geometry are always handled: the vector is never fetched, the geometry always is.
+    """
+    response_fields = get_filter_config().get("response_fields", {})
+    includes = list(response_fields.get("includes", []))
+    excludes = list(response_fields.get("excludes", []))
+
+    if "vector" not in excludes:
+        excludes.append("vector")
+    source_filter = {"excludes": excludes}
+    if includes:
+        if "coordinates" not in includes:
+            includes.append("coordinates")  # Needed for the GeoJSON geometry
+        source_filter["includes"] = includes
+    return source_filter
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_sort(lang, sort_field, sort_order):
+    """
+    Memoized build_sort_filter. The returned list is shared, do not modify it.
+    """
+    return build_sort_filter(lang, sort_field=sort_field, sort_order=sort_order)
+
+def knn_k(from_param, size):
+    """Number of neighbours needed to fill the requested page."""
+    return min(KNN_MAX_K, max(KNN_MIN_K, from_param + size))
+
+def oversampled_k(k, oversample_factor=KNN_OVERSAMPLE_FACTOR):
+    """Number of approximate neighbours to fetch for k results, see KNN_OVERSAMPLE_FACTOR."""
+    return min(KNN_MAX_K, max(k, math.ceil(k * oversample_factor)))
+
+def build_knn_clause(features, k, filters=None, filter_mode=KNN_FILTER_MODE, ef_search_factor=KNN_EF_SEARCH_FACTOR):
+    """
+    Builds the knn clause on the 'vector' field.
+
+    Args:
+        features (list): The query embedding.
+        k (int): Number of neighbours, see knn_k.
+        filters (list): Filter clauses, sent inside the clause in 'efficient' mode.
+        filter_mode (str): 'post' or 'efficient'.
+        ef_search_factor (float): When > 0, ef_search is set to k times this factor.
+
+    Returns:
+        dict: A knn query clause.
+
+    Raises:
+        ValueError: If the filter mode is unsupported.
+    """
+    if filter_mode not in KNN_FILTER_MODES:
+        raise ValueError(f"Unsupported kNN filter mode '{filter_mode}'. Must be one of {KNN_FILTER_MODES}.")
+
+    clause = {
+        "vector": features,
+        "k": k
+    }
+    if filter_mode == "efficient" and filters:
+        clause["filter"] = {"bool": {"filter": filters}}
+    if ef_search_factor > 0:
+        clause["method_parameters"] = {"ef_search": max(k, math.ceil(k * ef_search_factor))}
+
+    return {"knn": {"vector": clause}}
+
+def build_exact_knn_clause(features, filters=None, engine=KNN_ENGINE):
+    """
+    Builds an exact (brute-force) cosine scoring clause over the filtered documents.
+
+    The score uses the same scale as approximate cosinesimil kNN on the index's engine
+    (see KNN_COSINE_SCORE_SCRIPTS), so exactly scored and approximate hits compare,
+    and min_score and the other hybrid boosts keep their meaning.
+
+    Raises:
+        ValueError: If the engine is unsupported.
+    """
+    if engine not in KNN_COSINE_SCORE_SCRIPTS:
+        raise ValueError(f"Unsupported kNN engine '{engine}'. Must be one of {list(KNN_COSINE_SCORE_SCRIPTS)}.")
+    return {
+        "script_score": {
+            "query": {"bool": {"filter": filters if filters else [{"match_all": {}}]}},
+            "script": {
+                "source": KNN_COSINE_SCORE_SCRIPTS[engine],
+                "params": {
+                    "field": "vector",
+                    "query_value": features
+                }
+            }
+        }
+    }
+
+def build_rescore(rescore_query, window_size):
+    """
+    Rescore stage that replaces the score of the top window_size hits (per shard) by
+    the score of rescore_query, typically the same query with build_exact_knn_clause
+    in place of the approximate knn clause.
+    """
+    return {
+        "window_size": window_size,
+        "query": {
+            "rescore_query": rescore_query,
+            "query_weight": 0.0,
+            "rescore_query_weight": 1.0
+        }
+    }
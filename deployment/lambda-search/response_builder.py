@@ -0,0 +1,67 @@
+import json
+
+from os import environ
+
+# 'auto' uses orjson when it is installed, 'json' forces the standard library encoder
+JSON_BACKEND = environ.get('JSON_BACKEND', 'auto')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Source fields that never become GeoJSON properties
+_SKIPPED_FIELDS = frozenset(("vector", "coordinates"))
+
+
+def json_dumps(obj):
+    """
+    Serializes a response to a compact JSON string with the fastest available backend.
+    """
+    if orjson is not None and JSON_BACKEND != 'json':
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def create_api_response_geojson(search_results, lang):
+    """
+    Builds the API response from an OpenSearch search response in a single pass.
+
+    Each hit becomes a FeatureCollection holding one Feature: the geometry comes
+    from 'coordinates', the properties are row_num, relevancy and the remaining
+    _source fields. The hit's _source is read, never copied or modified.
+    """
+    hits_section = search_results['hits']
+    hits = hits_section['hits']
+
+    items = []
+    for count, hit in enumerate(hits, start=1):
+        source = hit.get('_source')
+        if source is None or 'coordinates' not in source:
+            print(f"Error processing hit: {hit} - missing _source coordinates")
+            continue
+
+        properties = {"row_num": count}
+        score = hit.get('_score', '')
+        if score is not None:  # _score is null when sorting on another field
+            properties["relevancy"] = score
+        for key, value in source.items():
+            if key not in _SKIPPED_FIELDS:
+                properties[key] = value
+
+        items.append({
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": source['coordinates'],
+                    "properties": properties
+                }
+            ]
+        })
+
+    return {
+        "total_hits": hits_section['total']['value'] if 'total' in hits_section else 0,  # Total docs matching the query
+        "returned_hits": len(hits),  # Number of docs returned (limited by size)
+        "aggs": search_results.get("aggregations", {}),
+        "items": items
+    }
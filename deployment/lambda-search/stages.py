@@ -0,0 +1,83 @@
+import time
+
+from os import environ
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+STAGE_WORKERS = int(environ.get('STAGE_WORKERS', '8'))
+REQUEST_DEADLINE_SECONDS = float(environ.get('REQUEST_DEADLINE_SECONDS', '25'))
+OPENSEARCH_REQUEST_TIMEOUT = float(environ.get('OPENSEARCH_REQUEST_TIMEOUT', '55'))
+
+# Shared by every invocation on the container; stages are short I/O calls
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
+
+class StageTimeout(Exception):
+    """Raised when a stage result is not available before the request deadline."""
+
+
+class StageGraph:
+    """
+    Small per-request graph of I/O stages run concurrently on a thread pool.
+
+    Stages are independent and start as soon as they are added; work that needs
+    a stage's result waits for it on the request thread with result(), never on
+    a pool worker. result() waits no longer than the request deadline, so request
+    latency follows the critical path instead of the sum of all stages.
+    """
+
+    def __init__(self, executor=stage_executor, deadline_seconds=REQUEST_DEADLINE_SECONDS, timer=None):
+        self.executor = executor
+        self.timer = timer
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_seconds
+        self._futures = {}
+        self._timings = {}
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def request_timeout(self, limit=OPENSEARCH_REQUEST_TIMEOUT, floor=0.5):
+        """
+        Timeout for a blocking call made on the request thread: what is left of the
+        deadline, capped at limit and no shorter than floor.
+        """
+        return max(floor, min(limit, self.remaining()))
+
+    def add(self, name, fn):
+        """Schedules fn on the executor."""
+        def run():
+            start = time.monotonic()
+            try:
+                return fn()
+            finally:
+                end = time.monotonic()
+                self._timings[name] = (start - self.started, end - self.started)
+                if self.timer is not None:
+                    self.timer.record(name, (end - start) * 1000)
+
+        self._futures[name] = self.executor.submit(run)
+        return self
+
+    def result(self, name):
+        """Waits for a stage, raising StageTimeout once the request deadline has passed."""
+        try:
+            return self._futures[name].result(timeout=self.remaining())
+        except FutureTimeoutError:
+            raise StageTimeout(f"Stage '{name}' did not finish within the request deadline")
+
+    def result_or_default(self, name, default=None):
+        """Like result(), but logs and returns default when the stage fails or times out."""
+        try:
+            return self.result(name)
+        except Exception as e:
+            print(f"Stage '{name}' failed: {e}")
+            return default
+
+    def timings(self):
+        """Per-stage (start, end) offsets in milliseconds plus the elapsed wall time."""
+        report = {
+            name: {"start_ms": round(start * 1000, 1), "end_ms": round(end * 1000, 1)}
+            for name, (start, end) in self._timings.items()
+        }
+        report["wall_ms"] = round((time.monotonic() - self.started) * 1000, 1)
+        return report
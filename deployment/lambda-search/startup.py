@@ -0,0 +1,86 @@
+import json
+import time
+import threading
+
+from os import environ
+
+# Load data and modules that only rare paths need on first use instead of during init.
+# Set to false under provisioned concurrency, where init runs before any traffic.
+LEAN_STARTUP = environ.get('LEAN_STARTUP', 'true').lower() == 'true'
+
+# Pay the first-request costs (connections, config, index check, top query vectors)
+# during init, so the first request of a container is served like any other
+PREWARM_ON_INIT = environ.get('PREWARM_ON_INIT', 'false').lower() == 'true'
+# Top queries to embed and cache while prewarming: '|'-separated, or a file with one per line
+PREWARM_QUERIES = environ.get('PREWARM_QUERIES', '')
+PREWARM_QUERIES_FILE = environ.get('PREWARM_QUERIES_FILE', '')
+# Time allowed for embedding the top queries; Lambda stops an init phase after 10 seconds
+PREWARM_QUERY_SECONDS = float(environ.get('PREWARM_QUERY_SECONDS', '4'))
+# Time allowed for the whole prewarm: steps still running are abandoned, later ones skipped
+PREWARM_SECONDS = float(environ.get('PREWARM_SECONDS', '8'))
+
+
+def prewarm_queries(queries=PREWARM_QUERIES, file_path=PREWARM_QUERIES_FILE):
+    """The configured top queries, in order and without duplicates or blanks."""
+    values = queries.split("|") if queries else []
+    if file_path:
+        try:
+            with open(file_path, "r") as file:
+                values.extend(file.read().splitlines())
+        except OSError as e:
+            print(f"Error reading prewarm queries from {file_path}: {e}")
+    return list(dict.fromkeys(value.strip() for value in values if value.strip()))
+
+def prewarm_deadline(seconds=PREWARM_SECONDS):
+    """time.monotonic() value by which a prewarm starting now has to be done."""
+    return time.monotonic() + seconds
+
+def run_step(step, timeout):
+    """
+    Runs step on a daemon thread and returns its result, raising TimeoutError when it
+    is still running after timeout seconds (it is left to finish in the background).
+    """
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = step()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, name="prewarm-step", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"still running after {timeout:.1f}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+def run_prewarm(steps, deadline=None):
+    """
+    Runs (name, function) steps in order, timing each one. A failing step is
+    reported and skipped so that it never fails the init phase. No step runs past
+    the deadline (see prewarm_deadline): one still running then is abandoned and
+    the remaining ones are skipped. Prints one JSON line with the duration of each
+    step and returns it as a dict.
+    """
+    deadline = prewarm_deadline() if deadline is None else deadline
+    started = time.perf_counter()
+    report = {"prewarm": {}, "errors": {}}
+    for name, step in steps:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            report.setdefault("skipped", []).append(name)
+            continue
+        start = time.perf_counter()
+        try:
+            result = run_step(step, remaining)
+            if result is not None:
+                report.setdefault("results", {})[name] = result
+        except Exception as e:
+            report["errors"][name] = f"{type(e).__name__}: {e}"
+        report["prewarm"][name] = round((time.perf_counter() - start) * 1000, 2)
+    report["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    print(json.dumps(report, default=str))
+    return report
@@ -0,0 +1,71 @@
+import json
+import time
+
+from os import environ
+from contextlib import contextmanager
+
+# One JSON log line per request with the duration of each stage
+TIMING_LOG = environ.get('TIMING_LOG', 'true').lower() == 'true'
+# Also send the spans to the client as a Server-Timing header (proxy response mode only)
+SERVER_TIMING_HEADER = environ.get('SERVER_TIMING_HEADER', 'false').lower() == 'true'
+
+# Callables that receive every request's timing record, e.g. the benchmark harness
+timing_listeners = []
+
+
+class RequestTimer:
+    """
+    Collects named durations (in milliseconds) for one request.
+
+    Spans are timed with span() or recorded from durations measured elsewhere
+    (OpenSearch 'took', stage graph timings) with record(). Recording is a dict
+    assignment, so stages running on other threads can record into the same timer.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.attributes = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, duration_ms):
+        if duration_ms is not None:
+            self.spans[name] = round(self.spans.get(name, 0.0) + duration_ms, 2)
+
+    def set(self, key, value):
+        """Adds a non-timing attribute to the log line, e.g. the cache outcome."""
+        self.attributes[key] = value
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def server_timing(self):
+        """Server-Timing header value: one 'name;dur=ms' metric per span plus the total."""
+        metrics = [f"{name};dur={duration}" for name, duration in self.spans.items()]
+        metrics.append(f"total;dur={self.elapsed_ms()}")
+        return ", ".join(metrics)
+
+    def log(self):
+        """Prints the structured timing line for the request and passes it to the listeners."""
+        record = {"timing": self.spans, "total_ms": self.elapsed_ms(), **self.attributes}
+        for listener in timing_listeners:
+            listener(record)
+        if TIMING_LOG:
+            print(json.dumps(record, default=str))
+
+
+@contextmanager
+def span(timer, name):
+    """timer.span(name), or nothing when there is no timer."""
+    if timer is None:
+        yield
+    else:
+        with timer.span(name):
+            yield
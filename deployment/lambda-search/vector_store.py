@@ -0,0 +1,181 @@
+import abc
+import time
+import boto3
+import hashlib
+import threading
+
+from os import environ
+from struct import pack, unpack
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import normalize_query
+
+# e.g. "dynamodb://semantic-search-embeddings", or "sqlite:///tmp/embeddings.db" for one container
+SHARED_EMBEDDING_CACHE = environ.get('SHARED_EMBEDDING_CACHE', '')
+# float16 halves the stored size, but then a query's vector (and its ranking) depends
+# on the tier that served it
+SHARED_EMBEDDING_DTYPE = environ.get('SHARED_EMBEDDING_DTYPE', 'float32')
+SHARED_EMBEDDING_TTL = int(environ.get('SHARED_EMBEDDING_TTL', '604800'))
+
+_STRUCT_CODES = {'float16': 'e', 'float32': 'f'}
+
+
+def encode_vector(vector, dtype=SHARED_EMBEDDING_DTYPE):
+    """Packs a vector into little-endian float16/float32 bytes."""
+    return pack(f"<{len(vector)}{_STRUCT_CODES[dtype]}", *vector)
+
+def decode_vector(blob, dtype=SHARED_EMBEDDING_DTYPE):
+    """Unpacks bytes written by encode_vector back into a list of floats."""
+    code = _STRUCT_CODES[dtype]
+    width = 2 if code == 'e' else 4
+    return list(unpack(f"<{len(blob) // width}{code}", blob))
+
+def vector_key(model_name, endpoint, query):
+    """Fixed-length key for a query vector, shared by every container."""
+    raw = f"{model_name}\x1f{endpoint}\x1f{normalize_query(query)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class VectorStore(abc.ABC):
+    """
+    Interface for a query-vector cache tier shared across Lambda containers.
+
+    Implementations store vectors as compact bytes and must never raise into the
+    search path; failures are reported as misses. The search path stores with
+    put_async, so a write never adds to a request's latency.
+    """
+
+    def __init__(self, dtype=SHARED_EMBEDDING_DTYPE, ttl=SHARED_EMBEDDING_TTL):
+        if dtype not in _STRUCT_CODES:
+            raise ValueError(f"Unsupported vector dtype '{dtype}'. Must be one of {list(_STRUCT_CODES)}.")
+        self.dtype = dtype
+        self.ttl = ttl
+
+    @abc.abstractmethod
+    def get(self, key):
+        """The cached vector for key, or None."""
+
+    @abc.abstractmethod
+    def put(self, key, vector):
+        """Stores a vector under key for ttl seconds."""
+
+    def put_async(self, key, vector):
+        """put() on the store's writer thread, without waiting for it."""
+        global _writer
+        with _writer_lock:
+            if _writer is None:
+                _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-store")
+        _writer.submit(self.put, key, vector)
+
+
+# One writer thread for the shared tier, started by the first put_async
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class SQLiteVectorStore(VectorStore):
+    """
+    File-backed store on a local path, for a single container or offline testing.
+    Do not share the file between containers over a network filesystem such as EFS:
+    SQLite's locking is unreliable there and the file can be corrupted. Use
+    DynamoDBVectorStore to share vectors. sqlite3 is only imported when this store
+    is used.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_vectors ("
+            "key TEXT PRIMARY KEY, dtype TEXT NOT NULL, vector BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        import sqlite3
+        try:
+            row = self._connection().execute(
+                "SELECT dtype, vector, expires_at FROM query_vectors WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared embedding cache read failed: {e}")
+            return None
+        if row is None or row[2] <= time.time():
+            return None
+        return decode_vector(row[1], row[0])
+
+    def put(self, key, vector):
+        import sqlite3
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO query_vectors (key, dtype, vector, expires_at) VALUES (?, ?, ?, ?)",
+                (key, self.dtype, encode_vector(vector, self.dtype), time.time() + self.ttl)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Shared embedding cache write failed: {e}")
+
+
+class DynamoDBVectorStore(VectorStore):
+    """
+    DynamoDB-backed store. The table needs a string partition key named 'key';
+    enable DynamoDB TTL on the 'expires_at' attribute to purge old vectors.
+    """
+
+    def __init__(self, table_name, region=None, **kwargs):
+        super().__init__(**kwargs)
+        self.table_name = table_name
+        self._client = boto3.client('dynamodb', region_name=region)
+
+    def get(self, key):
+        try:
+            item = self._client.get_item(TableName=self.table_name, Key={'key': {'S': key}}).get('Item')
+        except Exception as e:
+            print(f"Shared embedding cache read failed: {e}")
+            return None
+        if not item or float(item['expires_at']['N']) <= time.time():
+            return None
+        return decode_vector(item['vector']['B'], item['dtype']['S'])
+
+    def put(self, key, vector):
+        try:
+            self._client.put_item(TableName=self.table_name, Item={
+                'key': {'S': key},
+                'dtype': {'S': self.dtype},
+                'vector': {'B': encode_vector(vector, self.dtype)},
+                'expires_at': {'N': str(int(time.time() + self.ttl))}
+            })
+        except Exception as e:
+            print(f"Shared embedding cache write failed: {e}")
+
+
+def create_vector_store(url, region=None):
+    """
+    Builds a VectorStore from a URL: sqlite:///path/to/file.db or dynamodb://table-name.
+    Returns None when no shared tier is configured, or when it cannot be set up
+    (e.g. an unreachable mount), so that the tier never fails the container's init.
+    """
+    if not url:
+        return None
+    parsed = urlparse(url)
+    try:
+        if parsed.scheme == 'sqlite':
+            return SQLiteVectorStore(parsed.path)
+        if parsed.scheme == 'dynamodb':
+            return DynamoDBVectorStore(parsed.netloc, region=region)
+        raise ValueError(f"Unsupported shared embedding cache '{url}'. Use sqlite:// or dynamodb://.")
+    except Exception as e:
+        print(f"Shared embedding cache disabled: {e}")
+        return None
@@ -0,0 +1,197 @@
+"""
+Import-time profile of the Lambda handlers.
+
+Imports each handler's app module in a fresh interpreter with -X importtime (what a cold
+start pays before the first invocation) and reports the median total and the cost of
+each top-level package, first-party modules included. With --check the results are
+compared with import_budget.json: the exit status is nonzero when a handler is over its
+max_ms or imports one of its deferred modules at init.
+
+    python profile_imports.py [--handlers lambda-search ...] [--runs 5] [--top 15]
+                              [--check] [--write_budget] [--headroom 1.25]
+
+Run it with an interpreter that has the handlers' requirements installed; a handler's
+package/ directory (see build-lambda.sh) is used first when it exists.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from statistics import median
+
+DEPLOYMENT_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_PATH = os.path.join(DEPLOYMENT_DIR, "import_budget.json")
+
+# Environment each handler reads at import time. Placeholder credentials keep boto3
+# from probing the instance metadata service while the module loads.
+HANDLER_ENVIRONMENT = {
+    "lambda-search": {
+        "MY_AWS_REGION": "ca-central-1",
+        "OS_ENDPOINT": "opensearch.profile.local",
+        "SAGEMAKER_ENDPOINT": "profile-endpoint",
+        "OS_SECRET_ID": "profile/secret",
+        "MODEL_NAME": "mpnet-mpf-knn",
+        "NEW_INDEX_NAME": "profile-search-logs"
+    },
+    "lambda-search-logs": {},
+    "lambda-dashboard-proxy": {
+        "AWS_REGION": "ca-central-1",
+        "DASHBOARD_ENDPOINT": "https://opensearch.profile.local/_dashboards"
+    },
+    "lambda-dashboard-settings": {}
+}
+PROFILE_ENVIRONMENT = {
+    "AWS_ACCESS_KEY_ID": "profile",
+    "AWS_SECRET_ACCESS_KEY": "profile",
+    "AWS_EC2_METADATA_DISABLED": "true",
+    "TIMING_LOG": "false"
+}
+
+
+def handler_environment(handler):
+    """The caller's environment with the handler's variables filled in where unset."""
+    env = dict(os.environ)
+    for key, value in {**PROFILE_ENVIRONMENT, **HANDLER_ENVIRONMENT[handler]}.items():
+        env.setdefault(key, value)
+
+    handler_dir = os.path.join(DEPLOYMENT_DIR, handler)
+    paths = [handler_dir]
+    if os.path.isdir(os.path.join(handler_dir, "package")):
+        paths.insert(0, os.path.join(handler_dir, "package"))
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    return env
+
+def parse_importtime(stderr, root="app"):
+    """
+    Parses -X importtime output into (total_us, {module: self_us}) for the modules
+    imported while importing root, root itself included.
+    """
+    pending = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # The name is indented two spaces per nesting level after one separator space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        # Children are logged before their parent, so collect until the top-level line
+        pending[name] = int(self_us)
+        if depth == 0:
+            if name == root:
+                return int(cumulative_us), pending
+            pending = {}
+    raise RuntimeError(f"No import time recorded for '{root}'")
+
+# Prints the loaded module names as the last line: -X importtime also logs failed
+# imports, e.g. opensearch-py probing for aiohttp when it is not installed
+IMPORT_SCRIPT = "import app, sys, json; print(json.dumps(sorted(sys.modules)))"
+
+def profile_handler(handler, python=sys.executable):
+    """
+    Imports the handler's app module once and returns (total_ms, {module: self_ms})
+    for the modules that were actually loaded.
+    """
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", IMPORT_SCRIPT],
+        cwd=os.path.join(DEPLOYMENT_DIR, handler), env=handler_environment(handler),
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {handler}/app.py failed:\n{result.stderr[-2000:]}")
+    total_us, modules = parse_importtime(result.stderr)
+    loaded = set(json.loads(result.stdout.strip().splitlines()[-1]))
+    return total_us / 1000, {name: us / 1000 for name, us in modules.items() if name in loaded}
+
+def profile(handler, runs, python=sys.executable):
+    """Median total and per-package self time over several cold imports, and the modules imported."""
+    totals = []
+    packages = {}
+    imported = set()
+    for _ in range(runs):
+        total_ms, modules = profile_handler(handler, python)
+        totals.append(total_ms)
+        imported.update(modules)
+        run_packages = {}
+        for name, self_ms in modules.items():
+            package = name.split(".")[0]
+            run_packages[package] = run_packages.get(package, 0.0) + self_ms
+        for package, self_ms in run_packages.items():
+            packages.setdefault(package, []).append(self_ms)
+    return {
+        "total_ms": median(totals),
+        "packages": {package: median(values + [0.0] * (runs - len(values))) for package, values in packages.items()},
+        "modules": imported
+    }
+
+
+def report(handler, result, top):
+    print(f"{handler}: {result['total_ms']:.1f} ms, {len(result['modules'])} modules")
+    ranked = sorted(result["packages"].items(), key=lambda item: -item[1])
+    for package, self_ms in ranked[:top]:
+        print(f"    {package:<32} {self_ms:>9.2f} ms")
+    print()
+
+def check_budget(handler, result, budget):
+    """Budget violations of one handler as messages."""
+    failures = []
+    max_ms = budget.get("max_ms")
+    if max_ms is not None and result["total_ms"] > max_ms:
+        failures.append(f"{handler}: import took {result['total_ms']:.1f} ms, budget is {max_ms} ms")
+    for module in budget.get("deferred", []):
+        loaded = sorted(name for name in result["modules"] if name == module or name.startswith(module + "."))
+        if loaded:
+            failures.append(f"{handler}: '{module}' is imported at init but should be deferred ({', '.join(loaded[:3])})")
+    return failures
+
+def load_budget(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def main(args):
+    budgets = load_budget(args.budget)
+    failures = []
+    results = {}
+    for handler in args.handlers:
+        results[handler] = profile(handler, args.runs, args.python)
+        report(handler, results[handler], args.top)
+        if args.check:
+            failures.extend(check_budget(handler, results[handler], budgets.get(handler, {})))
+
+    if args.write_budget:
+        for handler, result in results.items():
+            budgets.setdefault(handler, {"deferred": []})["max_ms"] = round(result["total_ms"] * args.headroom, 1)
+        with open(args.budget, "w") as file:
+            json.dump(budgets, file, indent=2)
+            file.write("\n")
+        print(f"Wrote {args.budget}")
+
+    if args.check:
+        unbudgeted = [handler for handler in args.handlers if budgets.get(handler, {}).get("max_ms") is None]
+        if unbudgeted:
+            print(f"No max_ms for {', '.join(unbudgeted)}; set one with --write_budget")
+        for failure in failures:
+            print(f"FAIL {failure}")
+        if failures:
+            sys.exit(1)
+        print("Import budget OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import-time profile and startup budget check of the Lambda handlers.')
+    parser.add_argument('--handlers', type=str, nargs='+', default=list(HANDLER_ENVIRONMENT), choices=list(HANDLER_ENVIRONMENT), help='Handler directories to profile')
+    parser.add_argument('--runs', type=int, default=5, help='Cold imports per handler (the median is reported)')
+    parser.add_argument('--top', type=int, default=15, help='Packages listed per handler')
+    parser.add_argument('--python', type=str, default=sys.executable, help='Interpreter with the handler requirements installed')
+    parser.add_argument('--budget', type=str, default=BUDGET_PATH, help='Budget file')
+    parser.add_argument('--check', action='store_true', help='Exit nonzero when a handler is over its budget')
+    parser.add_argument('--write_budget', action='store_true', help='Set max_ms of the profiled handlers from this run')
+    parser.add_argument('--headroom', type=float, default=1.25, help='max_ms = median x headroom with --write_budget')
+
+    main(parser.parse_args())
@@ -1,6 +1,154 @@
-def main():
-    print("Hello from semantic-search-with-amazon-opensearch!")
+"""
+Standalone HTTP server for the semantic search API.
+
+Serves the same GET /search-opensearch contract as the API Gateway + Lambda
+deployment from a long-lived process: query parameters are mapped into the event
+lambda_handler expects (as the API Gateway mapping template does) and the handler
+runs on a thread pool, while its OpenSearch calls share one pooled async client
+on the server's event loop. Several worker processes can listen on the same port.
+
+    python main.py --port 8080 --workers 4
+
+The search Lambda's environment (MY_AWS_REGION, OS_ENDPOINT, SAGEMAKER_ENDPOINT,
+OS_SECRET_ID, MODEL_NAME, NEW_INDEX_NAME) must be set.
+"""
+import os
+import sys
+import time
+import base64
+import asyncio
+import argparse
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "deployment", "lambda-search"))
+
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8080'))
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', '1'))
+# In-flight requests per worker process
+SERVER_HANDLER_THREADS = int(os.environ.get('SERVER_HANDLER_THREADS', '128'))
+
+# Parameters of the API Gateway mapping template (see load_config in app.py)
+EVENT_PARAMS = [
+    "method", "q", "bbox", "relation", "begin", "end", "org", "type", "protocol", "mappable",
+    "theme", "topic_category", "foundational", "source_system", "eo_collection", "polarization",
+    "orbit_direction", "lang", "sort", "order", "size", "from", "paging", "cursor"
+]
+
+
+def build_event(request, body=None):
+    """
+    Maps an HTTP request to the Lambda event. Missing parameters are empty strings,
+    like $input.params() in the mapping template.
+    """
+    event = {param: request.query.get(param, "") for param in EVENT_PARAMS}
+    event["accept_encoding"] = request.headers.get("Accept-Encoding", "")
+    event["if_none_match"] = request.headers.get("If-None-Match", "")
+    event["ip_address"] = request.remote or ""
+    event["ip_address_forward"] = request.headers.get("X-Forwarded-For", "")
+    event["timestamp"] = int(time.time() * 1000)
+    event["user_agent"] = request.headers.get("User-Agent", "")
+    event["http_method"] = request.method
+    if body is not None:
+        event["body"] = body
+    return event
+
+def to_http_response(response, event):
+    """Turns a handler response (proxy or legacy shape) into an aiohttp response."""
+    from aiohttp import web
+    from http_response import build_http_response
+
+    if "headers" not in response:
+        response = build_http_response(response, event)
+    body = response.get("body", "")
+    body = base64.b64decode(body) if response.get("isBase64Encoded") else body.encode("utf-8")
+    return web.Response(status=response.get("statusCode", 200), headers=response["headers"], body=body)
+
+
+def create_app(handler_threads=SERVER_HANDLER_THREADS, prewarm_on_startup=False):
+    from aiohttp import web
+    from async_transport import bind_event_loop, close_async_clients
+    from pagination import InvalidCursor
+    from http_response import CORS_HEADERS, RequestError
+    from app import lambda_handler, prewarm
+
+    executor = ThreadPoolExecutor(max_workers=handler_threads, thread_name_prefix="handler")
+
+    async def search(request):
+        body = await request.text() if request.method == "POST" else None
+        event = build_event(request, body)
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(executor, lambda_handler, event, None)
+        except RequestError as e:
+            return web.json_response({"error": e.message}, status=e.status_code, headers=CORS_HEADERS)
+        except (InvalidCursor, ValueError) as e:
+            return web.json_response({"error": str(e)}, status=400, headers=CORS_HEADERS)
+        except Exception as e:
+            print(f"Error handling {request.path_qs}: {e}")
+            return web.json_response({"error": "Internal server error"}, status=500, headers=CORS_HEADERS)
+        return to_http_response(response, event)
+
+    async def health(request):
+        return web.Response(text="ok")
+
+    async def on_startup(app):
+        loop = asyncio.get_running_loop()
+        bind_event_loop(loop)
+        if prewarm_on_startup:
+            # After binding, so the pooled async client is created on this loop
+            await loop.run_in_executor(executor, prewarm)
+
+    async def on_cleanup(app):
+        await close_async_clients()
+        executor.shutdown(wait=False)
+
+    app = web.Application()
+    app.router.add_get("/search-opensearch", search)
+    app.router.add_post("/search-opensearch", search)
+    app.router.add_get("/health", health)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def serve(host, port, handler_threads):
+    # Set before the search modules read their configuration
+    os.environ.setdefault('OS_TRANSPORT', 'async')
+    os.environ.setdefault('HTTP_RESPONSE_MODE', 'proxy')
+    os.environ.setdefault('STAGE_WORKERS', str(handler_threads * 2))
+    # Prewarm on startup rather than while app.py is imported, before the loop exists
+    prewarm_on_startup = os.environ.pop('PREWARM_ON_INIT', 'false').lower() == 'true'
+
+    from aiohttp import web
+    # reuse_port lets every worker process accept on the same port
+    web.run_app(create_app(handler_threads, prewarm_on_startup), host=host, port=port, reuse_port=True, print=None)
+
+def main(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, handler_threads=SERVER_HANDLER_THREADS):
+    print(f"Serving /search-opensearch on {host}:{port} with {workers} worker(s)")
+    if workers <= 1:
+        serve(host, port, handler_threads)
+        return
+
+    processes = [
+        multiprocessing.Process(target=serve, args=(host, port, handler_threads), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Semantic search HTTP server.')
+    parser.add_argument('--host', type=str, default=SERVER_HOST, help='Listen address')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='Listen port')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='Worker processes')
+    parser.add_argument('--handler_threads', type=int, default=SERVER_HANDLER_THREADS, help='In-flight requests per worker')
+
+    args = parser.parse_args()
+
+    main(host=args.host, port=args.port, workers=args.workers, handler_threads=args.handler_threads)
@@ -10,7 +10,74 @@ from Preprocess_and_embed_text import read_parquet_from_s3_as_df
 import argparse
 
 
-def main(region, aos_host, os_secret_id, bucket, filename):
+def facet_field(edge_ngram=False):
+    """
+    Text field with the subfields used for filtering: 'keyword' (sorting, aggregations),
+    'normalized' (case-insensitive terms/prefix filters) and optionally 'edge' (partial words).
+    """
+    fields = {
+        "keyword": {"type": "keyword", "ignore_above": 256},
+        "normalized": {"type": "keyword", "normalizer": "lowercase_normalizer", "ignore_above": 256}
+    }
+    if edge_ngram:
+        fields["edge"] = {
+            "type": "text",
+            "analyzer": "edge_ngram_analyzer",
+            "search_analyzer": "edge_ngram_search_analyzer"
+        }
+    return {"type": "text", "fields": fields}
+
+
+# HNSW graph encodings. The graph holds the compressed vectors while the field keeps the
+# full-precision floats, which the search Lambda uses to rescore the top candidates exactly.
+VECTOR_COMPRESSION_METHODS = {
+    # 4 bytes per dimension
+    "none": None,
+    # 2 bytes per dimension, Faiss scalar quantization (cosinesimil on Faiss needs OpenSearch 2.19+)
+    "fp16": {
+        "name": "hnsw",
+        "engine": "faiss",
+        "space_type": "cosinesimil",
+        "parameters": {
+            "m": 16,
+            "ef_construction": 128,
+            "encoder": {"name": "sq", "parameters": {"type": "fp16", "clip": True}}
+        }
+    },
+    # 1 byte per dimension, Lucene scalar quantization to 7 bits (OpenSearch 2.16+). Lucene scores
+    # cosinesimil as (1 + cosine) / 2, so set KNN_ENGINE=lucene on the search Lambda
+    "int8": {
+        "name": "hnsw",
+        "engine": "lucene",
+        "space_type": "cosinesimil",
+        "parameters": {
+            "m": 16,
+            "ef_construction": 128,
+            "encoder": {"name": "sq", "parameters": {"confidence_interval": 1.0}}
+        }
+    }
+}
+
+
+def vector_field(compression="none", dimension=768):
+    """
+    knn_vector mapping for the embeddings, with the HNSW graph compressed as given
+    by VECTOR_COMPRESSION_METHODS.
+    """
+    if compression not in VECTOR_COMPRESSION_METHODS:
+        raise ValueError(f"Unsupported vector compression '{compression}'. Must be one of {list(VECTOR_COMPRESSION_METHODS)}.")
+    field = {
+        "type": "knn_vector",
+        "dimension": dimension,
+        "store": True
+    }
+    method = VECTOR_COMPRESSION_METHODS[compression]
+    if method is not None:
+        field["method"] = method
+    return field
+
+
+def main(region, aos_host, os_secret_id, bucket, filename, vector_compression="none"):
     awsauth = get_awsauth_from_secret(region, secret_id=os_secret_id)
     aos_client = create_opensearch_connection(aos_host, awsauth)
 
@@ -28,17 +95,57 @@ def main(region, aos_host, os_secret_id, bucket, filename):
                     "default": {
                         "type": "standard",
                         "stopwords": "_english_"
+                    },
+                    "edge_ngram_analyzer": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding", "edge_ngram_filter"]
+                    },
+                    "edge_ngram_search_analyzer": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding"]
+                    }
+                },
+                "filter": {
+                    "edge_ngram_filter": {
+                        "type": "edge_ngram",
+                        "min_gram": 2,
+                        "max_gram": 20
+                    }
+                },
+                "normalizer": {
+                    "lowercase_normalizer": {
+                        "type": "custom",
+                        "filter": ["lowercase", "asciifolding"]
                     }
                 }
             }
         },
         "mappings": {
             "properties": {
-                "vector": {
-                    "type": "knn_vector",
-                    "dimension": 768,
-                    "store": True
+                # Facet fields filtered by the search Lambda (see filter_modes in filter_config.json)
+                "type": facet_field(),
+                "topicCategory": facet_field(),
+                "systemName": facet_field(),
+                "eoCollection": facet_field(),
+                "eoFilters": {
+                    "properties": {
+                        "polarizations": facet_field(),
+                        "orbitState": facet_field()
+                    }
+                },
+                "contact": {
+                    "properties": {
+                        "organisation": {
+                            "properties": {
+                                "en": facet_field(edge_ngram=True),
+                                "fr": facet_field(edge_ngram=True)
+                            }
+                        }
+                    }
                 },
+                "vector": vector_field(vector_compression),
                 "coordinates": {
                     "type": "geo_shape",
                     "store": True
@@ -71,10 +178,11 @@ if __name__ == "__main__":
     parser.add_argument('--os_secret_id', type=str, required=True, help='OpenSearch Secret ID')
     parser.add_argument('--bucekt', type=str, required=True, help='embedding data S3 bucket')
     parser.add_argument('--filename', type=str, required=True, help='embedding data filename')
+    parser.add_argument('--vector_compression', type=str, default='none', choices=list(VECTOR_COMPRESSION_METHODS), help='HNSW graph vector encoding')
 
     args = parser.parse_args()
 
-    main(region=args.region, aos_host=args.aos_host, os_secret_id=args.os_secret_id, bucket=args.bucket, filename=args.filename)
+    main(region=args.region, aos_host=args.aos_host, os_secret_id=args.os_secret_id, bucket=args.bucket, filename=args.filename, vector_compression=args.vector_compression)
 
 #bucekt ='webpresence-nlp-data-preprocessing-dev'
 #filename='semantic_search_embeddings.parquet'
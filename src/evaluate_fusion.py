@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import argparse
+
+import boto3
+
+from opensearch import get_awsauth_from_secret, create_opensearch_connection
+
+# The fusion and query code is shared with the search Lambda
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deployment", "lambda-search"))
+from fusion import build_lexical_clause, build_hybrid_clauses, fuse, FUSION_METHODS
+from query_compiler import build_knn_clause
+
+
+def load_judgments(path):
+    """
+    Reads judged queries, one JSON object per line:
+    {"q": "flood maps", "relevant": ["<record id>", ...]}
+    """
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def embed(runtime_client, endpoint_name, text):
+    response = runtime_client.invoke_endpoint(EndpointName=endpoint_name, ContentType='text/plain', Body=text)
+    return json.loads(response['Body'].read().decode())
+
+def ranked_ids(search_results):
+    """Record ids (the 'id' source field, else _id) with scores, in rank order."""
+    return [
+        {"id": hit.get("_source", {}).get("id", hit["_id"]), "_id": hit["_id"], "_score": hit["_score"]}
+        for hit in search_results["hits"]["hits"]
+    ]
+
+def collect_runs(judgments, aos_client, runtime_client, endpoint_name, index_name, k):
+    """
+    Runs the lexical leg, the vector leg and the single-query hybrid search for every
+    judged query and keeps the ranked ids, so fusion settings can be compared offline.
+    """
+    runs = {}
+    for judgment in judgments:
+        q = judgment["q"]
+        features = embed(runtime_client, endpoint_name, q)
+        knn_clause = build_knn_clause(features, k, filter_mode="post", ef_search_factor=0)
+        source = {"includes": ["id"]}
+        legs = {
+            "lexical": {"size": k, "_source": source, "query": build_lexical_clause(q)},
+            "vector": {"size": k, "_source": source, "query": knn_clause},
+            "hybrid": {
+                "size": k,
+                "_source": source,
+                "min_score": 0.55,
+                "query": {"bool": {"should": build_hybrid_clauses(q, knn_clause), "minimum_should_match": 1}}
+            }
+        }
+        runs[q] = {name: ranked_ids(aos_client.search(index=index_name, body=body)) for name, body in legs.items()}
+        print(f"Collected {q!r}: " + ", ".join(f"{name}={len(hits)}" for name, hits in runs[q].items()))
+    return runs
+
+def reciprocal_rank(ranking, relevant, cutoff):
+    for rank, doc_id in enumerate(ranking[:cutoff], start=1):
+        if doc_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+def recall(ranking, relevant, cutoff):
+    return len(set(ranking[:cutoff]) & relevant) / len(relevant) if relevant else 0.0
+
+def evaluate(judgments, runs, cutoff, leg_ks, weight_grid):
+    """
+    MRR@cutoff and Recall@cutoff of each leg, the hybrid query and each fusion setting.
+    Fusion is evaluated on the top leg_k hits of each leg to show the cost of smaller legs.
+    """
+    systems = {"lexical": lambda run: run["lexical"], "vector": lambda run: run["vector"], "hybrid": lambda run: run["hybrid"]}
+    for method in FUSION_METHODS:
+        for leg_k in leg_ks:
+            for lexical_weight, vector_weight in weight_grid:
+                name = f"{method} k={leg_k} w={lexical_weight:g}/{vector_weight:g}"
+                systems[name] = (lambda method, leg_k, weights: lambda run: [
+                    hit for _, hit in fuse([run["lexical"][:leg_k], run["vector"][:leg_k]], method, weights)
+                ])(method, leg_k, [lexical_weight, vector_weight])
+
+    results = []
+    for name, system in systems.items():
+        mrr, rec, judged = 0.0, 0.0, 0
+        for judgment in judgments:
+            run = runs.get(judgment["q"])
+            if run is None:
+                continue
+            relevant = set(judgment["relevant"])
+            ranking = [hit["id"] for hit in system(run)]
+            mrr += reciprocal_rank(ranking, relevant, cutoff)
+            rec += recall(ranking, relevant, cutoff)
+            judged += 1
+        if judged:
+            results.append((name, mrr / judged, rec / judged))
+    return results
+
+def parse_weights(value):
+    """'1:1,1:2' -> [(1.0, 1.0), (1.0, 2.0)] as (lexical, vector) weights."""
+    return [tuple(float(weight) for weight in pair.split(":")) for pair in value.split(",")]
+
+
+def main(args):
+    judgments = load_judgments(args.judgments)
+
+    if args.collect:
+        awsauth = get_awsauth_from_secret(args.region, secret_id=args.os_secret_id)
+        aos_client = create_opensearch_connection(args.aos_host, awsauth)
+        runtime_client = boto3.client('runtime.sagemaker', region_name=args.region)
+        runs = collect_runs(judgments, aos_client, runtime_client, args.sagemaker_endpoint, args.index, max(args.leg_k))
+        with open(args.runs, "w") as file:
+            json.dump(runs, file)
+        print(f"Saved runs for {len(runs)} queries to {args.runs}")
+
+    with open(args.runs, "r") as file:
+        runs = json.load(file)
+
+    results = evaluate(judgments, runs, args.cutoff, args.leg_k, parse_weights(args.weights))
+    print(f"{'system':<32} {'MRR@' + str(args.cutoff):>8} {'Recall@' + str(args.cutoff):>10}")
+    for name, mrr, rec in sorted(results, key=lambda result: -result[1]):
+        print(f"{name:<32} {mrr:>8.4f} {rec:>10.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Offline evaluation of hybrid search vs reciprocal-rank and min-max fusion.')
+    parser.add_argument('--judgments', type=str, required=True, help='JSONL of {"q": ..., "relevant": [record ids]}')
+    parser.add_argument('--runs', type=str, default='fusion_runs.json', help='Ranked results per query, written by --collect')
+    parser.add_argument('--collect', action='store_true', help='Query OpenSearch and save the runs before evaluating')
+    parser.add_argument('--region', type=str, help='AWS region')
+    parser.add_argument('--aos_host', type=str, help='OpenSearch host')
+    parser.add_argument('--os_secret_id', type=str, help='OpenSearch Secret ID')
+    parser.add_argument('--sagemaker_endpoint', type=str, help='SageMaker embedding endpoint')
+    parser.add_argument('--index', type=str, default='mpnet-mpf-knn', help='Index name')
+    parser.add_argument('--cutoff', type=int, default=5, help='Rank cutoff for MRR and Recall')
+    parser.add_argument('--leg_k', type=int, nargs='+', default=[10, 20, 50], help='Candidates per leg to evaluate')
+    parser.add_argument('--weights', type=str, default='1:1,1:2,2:1', help='lexical:vector weight pairs')
+
+    main(parser.parse_args())
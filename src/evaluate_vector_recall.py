@@ -0,0 +1,100 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Bytes per dimension stored in the HNSW graph for each --vector_compression of Create_Opensearch_index.py
+BYTES_PER_DIMENSION = {"none": 4, "fp16": 2, "int8": 1}
+
+
+def load_vectors(parquet=None, region=None, bucket=None, filename=None):
+    """Embeddings of the exported parquet ('vector' column) as a float32 matrix."""
+    if parquet:
+        df = pd.read_parquet(parquet)
+    else:
+        from Preprocess_and_embed_text import read_parquet_from_s3_as_df
+        df = read_parquet_from_s3_as_df(region, bucket, filename)
+    return np.vstack(df['vector'].to_numpy()).astype(np.float32)
+
+def normalize(vectors):
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+def compress(vectors, compression, confidence_interval=1.0, bits=7):
+    """
+    Simulates the graph encoding and returns the decoded vectors:
+    fp16 casts to half precision, int8 scalar quantizes each dimension between its
+    quantiles (the whole range when confidence_interval is 1.0) into 2**bits levels.
+    """
+    if compression == "none":
+        return vectors
+    if compression == "fp16":
+        return vectors.astype(np.float16).astype(np.float32)
+    if compression == "int8":
+        tail = (1.0 - confidence_interval) / 2
+        low = np.quantile(vectors, tail, axis=0)
+        high = np.quantile(vectors, 1.0 - tail, axis=0)
+        scale = np.where(high > low, (high - low) / (2 ** bits - 1), 1.0)
+        codes = np.round((np.clip(vectors, low, high) - low) / scale)
+        return (codes * scale + low).astype(np.float32)
+    raise ValueError(f"Unsupported vector compression '{compression}'. Must be one of {list(BYTES_PER_DIMENSION)}.")
+
+def top_k(scores, k):
+    """Indices of the k highest scores of each row, best first."""
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+def recall_at_k(corpus, query_ids, compressed, k, oversample_factors, batch_size=256):
+    """
+    Recall@k of exact-cosine neighbours when the top k * factor neighbours by compressed
+    vectors are rescored exactly. A query document is excluded from its own neighbours.
+    """
+    hits = {factor: 0 for factor in oversample_factors}
+    window = max(int(np.ceil(k * factor)) for factor in oversample_factors)
+    for start in range(0, len(query_ids), batch_size):
+        ids = query_ids[start:start + batch_size]
+        queries = corpus[ids]
+
+        exact = queries @ corpus.T
+        approximate = queries @ compressed.T
+        exact[np.arange(len(ids)), ids] = -np.inf
+        approximate[np.arange(len(ids)), ids] = -np.inf
+
+        truth = top_k(exact, k)
+        candidates = top_k(approximate, window)
+        for factor in oversample_factors:
+            window_ids = candidates[:, :max(k, int(np.ceil(k * factor)))]
+            rescored = np.take_along_axis(exact, window_ids, axis=1)
+            found = np.take_along_axis(window_ids, top_k(rescored, k), axis=1)
+            hits[factor] += sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+    return {factor: hits[factor] / (len(query_ids) * k) for factor in oversample_factors}
+
+
+def main(args):
+    vectors = load_vectors(args.parquet, args.region, args.bucket, args.filename)
+    corpus = normalize(vectors)
+    rng = np.random.default_rng(args.seed)
+    query_ids = rng.choice(len(corpus), size=min(args.num_queries, len(corpus)), replace=False)
+    print(f"{len(corpus)} vectors of {corpus.shape[1]} dimensions, {len(query_ids)} queries, k={args.k}")
+
+    print(f"{'compression':<12} {'bytes/vector':>12} " + " ".join(f"{'x' + format(factor, 'g'):>8}" for factor in args.oversample))
+    for compression in args.compression:
+        compressed = normalize(compress(vectors, compression, args.confidence_interval))
+        recalls = recall_at_k(corpus, query_ids, compressed, args.k, args.oversample)
+        print(f"{compression:<12} {BYTES_PER_DIMENSION[compression] * corpus.shape[1]:>12} " + " ".join(f"{recalls[factor]:>8.4f}" for factor in args.oversample))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Recall@k of compressed-vector retrieval with oversampling and exact rescoring.')
+    parser.add_argument('--parquet', type=str, help='Local embedding parquet file')
+    parser.add_argument('--region', type=str, help='AWS region (when reading from S3)')
+    parser.add_argument('--bucket', type=str, help='embedding data S3 bucket')
+    parser.add_argument('--filename', type=str, help='embedding data filename')
+    parser.add_argument('--k', type=int, default=10, help='Neighbours per query')
+    parser.add_argument('--num_queries', type=int, default=1000, help='Corpus documents sampled as queries')
+    parser.add_argument('--compression', type=str, nargs='+', default=['fp16', 'int8'], choices=list(BYTES_PER_DIMENSION), help='Encodings to evaluate')
+    parser.add_argument('--oversample', type=float, nargs='+', default=[1.0, 2.0, 3.0, 5.0], help='Oversample factors (KNN_OVERSAMPLE_FACTOR)')
+    parser.add_argument('--confidence_interval', type=float, default=1.0, help='int8 quantization range quantile')
+    parser.add_argument('--seed', type=int, default=0, help='Query sampling seed')
+
+    main(parser.parse_args())
@@ -0,0 +1,115 @@
+import os
+import sys
+import shutil
+import argparse
+import importlib.util
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModel
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEPLOYED_INFERENCE = os.path.join(REPO_ROOT, "deployment", "pytorch", "code", "inference.py")
+LOCAL_ENCODER = os.path.join(REPO_ROOT, "deployment", "lambda-search", "local_encoder.py")
+
+PARITY_QUERIES = [
+    "wildfire",
+    "flood risk maps for Quebec",
+    "Sentinel-1 SAR imagery",
+    "données sur la qualité de l'eau",
+    "elevation model of the Canadian Arctic with 30 m resolution",
+    "RCM",
+]
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def export_onnx(model_dir, output_dir, opset=14):
+    """
+    Exports the token-embedding model to ONNX and writes an int8 dynamically
+    quantized copy next to it, with the fast tokenizer the Lambda loads.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_dir)
+    model.eval()
+
+    sample = tokenizer(["a sample search query"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    int8_path = os.path.join(output_dir, "model.int8.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    for name in ("tokenizer.json",):
+        source = os.path.join(model_dir, name)
+        if os.path.exists(source):
+            shutil.copy(source, os.path.join(output_dir, name))
+
+    print(f"fp32 model: {os.path.getsize(fp32_path) / 1e6:.1f} MB, int8 model: {os.path.getsize(int8_path) / 1e6:.1f} MB")
+    return int8_path
+
+def cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+def check_parity(model_dir, output_dir, queries=PARITY_QUERIES, tolerance=0.99):
+    """
+    Compares the local encoder against model_fn/predict_fn of the deployed endpoint
+    code for each query. Returns True when every cosine similarity is >= tolerance.
+    """
+    deployed = load_module("deployed_inference", DEPLOYED_INFERENCE)
+    local = load_module("local_encoder", LOCAL_ENCODER)
+
+    reference_model = deployed.model_fn(model_dir)
+    encoder = local.LocalQueryEncoder(model_dir=output_dir, normalize=False)
+
+    passed = True
+    for query in queries:
+        expected = deployed.predict_fn(deployed.input_fn(query.encode("utf-8")), reference_model)
+        actual = encoder.encode(query)
+        similarity = cosine(expected, actual)
+        status = "ok" if similarity >= tolerance else "FAIL"
+        passed = passed and similarity >= tolerance
+        print(f"{status:4} cosine={similarity:.5f} dims={len(actual)} {query!r}")
+    return passed
+
+
+def main(model_dir, output_dir, tolerance, skip_export):
+    if not skip_export:
+        export_onnx(model_dir, output_dir)
+    if not check_parity(model_dir, output_dir, tolerance=tolerance):
+        print(f"Local encoder is not within cosine tolerance {tolerance} of the deployed model.")
+        sys.exit(1)
+    print("Local encoder matches the deployed model.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export an int8 ONNX query encoder for the search Lambda and check parity.')
+    parser.add_argument('--model_dir', type=str, required=True, help='Directory of the deployed Hugging Face model (with weights)')
+    parser.add_argument('--output_dir', type=str, default=os.path.join(REPO_ROOT, "deployment", "lambda-search", "encoder"), help='Export directory')
+    parser.add_argument('--tolerance', type=float, default=0.99, help='Minimum cosine similarity to the deployed model')
+    parser.add_argument('--skip_export', action='store_true', help='Only run the parity check against an existing export')
+
+    args = parser.parse_args()
+
+    main(model_dir=args.model_dir, output_dir=args.output_dir, tolerance=args.tolerance, skip_export=args.skip_export)